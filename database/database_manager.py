@@ -1,5 +1,6 @@
 import os
 import sqlite3
+import hashlib
 from typing import Iterable, List, Optional, Tuple, Dict, Any
 
 DB_FILE = "database/observance.db"
@@ -94,24 +95,50 @@ def insert_extracted_texts(
 ) -> None:
     """
     Insert structured extracted text into 'extracted_texts'.
-    Schema: (file_id, content, synthese, conclusion)
+    Schema: (file_id, content, synthese, avis_detaille, content_hash, content_start)
+    Section offsets are stored for avis texts only (a réponse has no avis sections).
     """
     content = avis_complet if avis_complet is not None else response
     with get_connection() as conn:
-        conn.execute(
+        cur = conn.execute(
             """
-            INSERT INTO extracted_texts (file_id, content, synthese, conclusion)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO extracted_texts (file_id, content, synthese, avis_detaille, content_hash, content_start)
+            VALUES (?, ?, ?, ?, ?, ?)
             """,
-            (avis_file_id, content, synthese, None),
+            (avis_file_id, content, synthese, None, *(_content_key(content) if content is not None else (None, None))),
         )
+        if avis_complet is not None:
+            _store_section_offsets(conn, cur.lastrowid, avis_complet)
+
+def content_hash(content: str) -> str:
+    """sha1 of the stripped text (extracted_texts.content_hash)."""
+    return hashlib.sha1(content.strip().encode("utf-8")).hexdigest()
+
+def _content_key(content: str) -> Tuple[str, int]:
+    """(content_hash, content_start): hash of the stripped text and where it starts in `content`."""
+    return content_hash(content), len(content) - len(content.lstrip())
+
+def backfill_content_hashes() -> int:
+    """Store content_hash/content_start for every extracted text that has none yet (e.g. after a CSV import)."""
+    with get_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, content FROM extracted_texts
+            WHERE (content_hash IS NULL OR content_start IS NULL) AND content IS NOT NULL
+            """
+        ).fetchall()
+        conn.executemany(
+            "UPDATE extracted_texts SET content_hash = ?, content_start = ? WHERE id = ?",
+            [(*_content_key(row["content"]), row["id"]) for row in rows],
+        )
+    return len(rows)
 
 def get_texts_by_avis_id(avis_file_id: int) -> Optional[Dict[str, Optional[str]]]:
     """Get latest extracted sections by file_id (formerly 'avis_id')."""
     with get_connection() as conn:
         row = conn.execute(
             """
-            SELECT content, synthese, conclusion
+            SELECT content, synthese
             FROM extracted_texts
             WHERE file_id = ?
             ORDER BY id DESC
@@ -127,7 +154,75 @@ def get_texts_by_avis_id(avis_file_id: int) -> Optional[Dict[str, Optional[str]]
             "recommandations": None,
             "response": None,
         }
-    
+
+# ------------------------------
+# Section offsets (text_sections)
+# ------------------------------
+def _store_section_offsets(conn: sqlite3.Connection, extracted_text_id: int, content: Optional[str]) -> int:
+    """Compute the section boundaries of `content` once and store them. Returns the number of sections."""
+    from processing.extract_sections_avis import find_section_offsets
+    if not content:
+        return 0
+    offsets = find_section_offsets(content)
+    conn.execute("DELETE FROM text_sections WHERE extracted_text_id = ?", (extracted_text_id,))
+    conn.executemany(
+        """
+        INSERT INTO text_sections (extracted_text_id, section, start_offset, end_offset, heading)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [(extracted_text_id, section, start, end, heading) for section, start, end, heading in offsets],
+    )
+    return len(offsets)
+
+def backfill_section_offsets() -> int:
+    """Store section offsets for every avis text that has none yet (e.g. after a CSV import)."""
+    nb_texts = 0
+    with get_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT et.id, et.content
+            FROM extracted_texts et
+            LEFT JOIN files f ON f.id = et.file_id
+            WHERE COALESCE(f.file_type, 'avis') != 'reponse'
+              AND NOT EXISTS (SELECT 1 FROM text_sections ts WHERE ts.extracted_text_id = et.id)
+            """
+        ).fetchall()
+        for row in rows:
+            if _store_section_offsets(conn, row["id"], row["content"]):
+                nb_texts += 1
+    return nb_texts
+
+def get_section_offsets(file_id: int) -> List[Dict[str, Any]]:
+    """Section boundaries of the latest extracted text of a file, in text order."""
+    with get_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT ts.section, ts.start_offset, ts.end_offset, ts.heading
+            FROM text_sections ts
+            WHERE ts.extracted_text_id = (
+                SELECT id FROM extracted_texts WHERE file_id = ? ORDER BY id DESC LIMIT 1
+            )
+            ORDER BY ts.start_offset
+            """,
+            (file_id,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+def get_section_text(file_id: int, section: str) -> Optional[str]:
+    """Slice one section out of the latest extracted text by its stored offsets (no regex)."""
+    with get_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT substr(et.content, ts.start_offset + 1, ts.end_offset - ts.start_offset) AS text
+            FROM text_sections ts
+            JOIN extracted_texts et ON et.id = ts.extracted_text_id
+            WHERE et.id = (SELECT id FROM extracted_texts WHERE file_id = ? ORDER BY id DESC LIMIT 1)
+              AND ts.section = ?
+            """,
+            (file_id, section),
+        ).fetchone()
+        return row["text"] if row else None
+
 # ------------------------------
 # Recommendations (3 cols)
 # ------------------------------
@@ -160,6 +255,33 @@ def bulk_insert_recommendations(
         )
         return conn.total_changes
 
+def replace_recommendations(
+    file_ids: Iterable[int], rows: Iterable[Tuple[int, Optional[int], str]]
+) -> int:
+    """
+    Replace the extracted (source='auto') recommendations of `file_ids` by `rows` (file_id,
+    recommandation_index, recommandation_text) in one transaction, so re-running an extraction
+    does not duplicate them. Curated rows (source='csv') are never deleted.
+    """
+    file_ids = [(file_id,) for file_id in file_ids]
+    rows = list(rows)
+    with get_connection() as conn:
+        conn.executemany("DELETE FROM recommendations WHERE file_id = ? AND source = 'auto'", file_ids)
+        conn.executemany(
+            """
+            INSERT INTO recommendations (file_id, recommandation_index, recommandation_text, source)
+            VALUES (?, ?, ?, 'auto')
+            """,
+            rows,
+        )
+    return len(rows)
+
+def get_curated_recommendation_files() -> set:
+    """file_ids holding curated recommendations (source='csv', e.g. recommendations_table.csv)."""
+    with get_connection() as conn:
+        rows = conn.execute("SELECT DISTINCT file_id FROM recommendations WHERE source = 'csv'").fetchall()
+        return {r["file_id"] for r in rows}
+
 def get_recommendations_by_file(file_id: int, order: bool = True) -> List[Dict[str, Any]]:
     sql = "SELECT id, file_id, recommandation_index, recommandation_text FROM recommendations WHERE file_id = ?"
     if order:
@@ -168,6 +290,59 @@ def get_recommendations_by_file(file_id: int, order: bool = True) -> List[Dict[s
         rows = conn.execute(sql, (file_id,)).fetchall()
         return [dict(r) for r in rows]
 
+def replace_alignments(
+    couples: Iterable[Tuple[int, int]], rows: Iterable[Tuple[Any, ...]]
+) -> int:
+    """
+    Replace the alignments of the (avis_id, reponse_id) couples by `rows`
+    (recommendation_id, reponse_id, project_id, model, score, start_offset, end_offset,
+    matched_text) in one transaction.
+    """
+    rows = list(rows)
+    with get_connection() as conn:
+        conn.executemany(
+            """
+            DELETE FROM recommendation_alignments
+            WHERE reponse_id = ?
+              AND recommendation_id IN (SELECT id FROM recommendations WHERE file_id = ?)
+            """,
+            [(reponse_id, avis_id) for avis_id, reponse_id in couples],
+        )
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO recommendation_alignments
+              (recommendation_id, reponse_id, project_id, model, score,
+               start_offset, end_offset, matched_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+    return len(rows)
+
+def get_taux_prise_en_compte(min_score: float, project_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Share of recommendations whose best-matching réponse passage scores at least `min_score`,
+    per project (see processing/align_recommendations.py for the threshold). Every recommendation
+    of the avis of a couple counts: those without alignment (no réponse text) are not addressed.
+    """
+    sql = """
+        SELECT c.project_id,
+               COUNT(*) AS nb_recommandations,
+               SUM(COALESCE(a.score >= ?, 0)) AS nb_prises_en_compte,
+               AVG(COALESCE(a.score >= ?, 0)) AS taux_prise_en_compte
+        FROM couples c
+        JOIN recommendations r ON r.file_id = c.avis_id
+        LEFT JOIN recommendation_alignments a ON a.recommendation_id = r.id AND a.reponse_id = c.reponse_id
+    """
+    params: Tuple[Any, ...] = (min_score, min_score)
+    if project_id is not None:
+        sql += " WHERE c.project_id = ?"
+        params += (project_id,)
+    sql += " GROUP BY c.project_id ORDER BY c.project_id"
+    with get_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+        return [dict(r) for r in rows]
+
 def search_recommendations_fts(query: str, limit: int = 20) -> List[Dict[str, Any]]:
     """FTS5 search on recommendations.recommandation_text."""
     with get_connection() as conn:
@@ -183,6 +358,35 @@ def search_recommendations_fts(query: str, limit: int = 20) -> List[Dict[str, An
         ).fetchall()
         return [dict(r) for r in rows]
 
+# ------------------------------
+# Near-duplicates (files / text_chunks)
+# ------------------------------
+def replace_duplicates(table: str, duplicates: Dict[int, int]) -> int:
+    """
+    Set duplicate_of of `table` ('files' or 'text_chunks') to `duplicates` {id: canonical_id}
+    and reset it for every other row. Only rows whose value changes are updated
+    (the FTS trigger of text_chunks only fires on text updates, so these leave the FTS index alone).
+    """
+    if table not in ("files", "text_chunks"):
+        raise ValueError(f"Unsupported table: {table}")
+    with get_connection() as conn:
+        current = dict(conn.execute(f"SELECT id, duplicate_of FROM {table} WHERE duplicate_of IS NOT NULL").fetchall())
+        changes = [(None, row_id) for row_id in current if row_id not in duplicates]
+        changes += [(canonical, row_id) for row_id, canonical in duplicates.items() if current.get(row_id) != canonical]
+        conn.executemany(f"UPDATE {table} SET duplicate_of = ? WHERE id = ?", changes)
+    return len(changes)
+
+def update_chunk_quality(rows: Iterable[Tuple[float, int, int]]) -> int:
+    """Store (quality_score, low_quality, chunk_id) rows, updating only the chunks whose values change."""
+    with get_connection() as conn:
+        current = {
+            r["id"]: (r["quality_score"], r["low_quality"])
+            for r in conn.execute("SELECT id, quality_score, low_quality FROM text_chunks")
+        }
+        changes = [row for row in rows if current.get(row[2]) != (row[0], row[1])]
+        conn.executemany("UPDATE text_chunks SET quality_score = ?, low_quality = ? WHERE id = ?", changes)
+    return len(changes)
+
 # ------------------------------
 # Text chunks (for RAG)
 # ------------------------------
@@ -192,13 +192,33 @@ def import_csv_to_db():
     # ===== 9) TEXT_CHUNK_EMBEDDINGS =====
     embeds_path = os.path.join(CSV_DIR, "text_chunk_embeddings.csv")
     if os.path.exists(embeds_path):
+        from init_database import _vector_json_rows
+
         embeds_df = pd.read_csv(embeds_path)
-        embeds_keep = ["chunk_id", "model", "dim", "vector_json", "created_at"]
+        embeds_keep = ["chunk_id", "model", "dim", "created_at", "vector_json", "text_hash"]
         for col in embeds_keep:
             if col not in embeds_df.columns:
                 embeds_df[col] = None
-        embeds_df[embeds_keep].to_sql("text_chunk_embeddings", conn, if_exists="append", index=False)
-        print("text_chunk_embeddings: imported")
+        embeds_df = embeds_df[embeds_keep].astype(object).where(embeds_df[embeds_keep].notna(), None)
+
+        # Same conversion as the vector_json migration of init_database.py:
+        # vectors go to embedding_cache (float32, keyed by text hash), records to text_chunk_embeddings
+        texts = dict(conn.execute("SELECT id, text FROM text_chunks").fetchall())
+        rows = [
+            (int(chunk_id), model, int(dim) if dim is not None else None, created_at, vector_json,
+             text_hash, texts.get(int(chunk_id)))
+            for chunk_id, model, dim, created_at, vector_json, text_hash in embeds_df.itertuples(index=False)
+        ]
+        records, cache = _vector_json_rows(rows)
+        conn.executemany(
+            "INSERT OR IGNORE INTO embedding_cache (text_hash, model, dim, vector) VALUES (?, ?, ?, ?)", cache
+        )
+        conn.executemany("""
+            INSERT OR REPLACE INTO text_chunk_embeddings (chunk_id, model, dim, text_hash, created_at)
+            VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        """, [(chunk_id, model, dim, h, created_at) for chunk_id, model, dim, h, created_at in records
+              if chunk_id in texts and h is not None and dim is not None])
+        print(f"text_chunk_embeddings: imported ({len(cache)} vecteurs dans embedding_cache)")
 
     # ===== 10) FTS5 sync =====
     conn.execute("DELETE FROM text_chunks_fts")
@@ -1,8 +1,68 @@
 import os
+import json
+import struct
 import sqlite3
+import hashlib
 
 DB_FILE = os.path.join(os.path.dirname(__file__), "observance.db")
 
+def _ensure_column(c, table, column, decl):
+    """Add `column` to a table created by an older version of this script (CREATE TABLE IF NOT EXISTS keeps it as is)."""
+    columns = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+TEXT_CHUNK_EMBEDDINGS = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        chunk_id INTEGER PRIMARY KEY,
+        model TEXT NOT NULL,
+        dim INTEGER NOT NULL,
+        text_hash TEXT,                -- sha1 of the embedded text (incremental Chroma indexing)
+        meta_hash TEXT,                -- sha1 of the Chroma metadata (project_id, section...) last upserted
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (chunk_id) REFERENCES text_chunks(id) ON DELETE CASCADE
+    )
+'''
+
+def _vector_json_rows(rows):
+    """
+    (chunk_id, model, dim, created_at, vector_json, text_hash, text) rows of the former
+    text_chunk_embeddings -> (records, embedding_cache rows). The text hash (sha1) is computed
+    from the chunk text when missing; vectors are packed as little-endian float32, as in
+    utils/embedding_cache.py (inlined: this script also runs as `python database/init_database.py`).
+    """
+    records, cache = [], []
+    for chunk_id, model, dim, created_at, vector_json, recorded, text in rows:
+        h = recorded or (hashlib.sha1(text.encode("utf-8")).hexdigest() if text is not None else None)
+        vector = json.loads(vector_json) if vector_json else None
+        dim = dim or (len(vector) if vector is not None else None)
+        records.append((chunk_id, model, dim, h, created_at))
+        if h is not None and vector is not None:
+            cache.append((h, model, dim, struct.pack(f"<{len(vector)}f", *vector)))
+    return records, cache
+
+def _migrate_vector_json(c, columns):
+    """Move the JSON vectors of text_chunk_embeddings to embedding_cache, then rebuild the table without vector_json."""
+    recorded_hash = "e.text_hash" if "text_hash" in columns else "NULL"
+    rows = c.execute(f"""
+        SELECT e.chunk_id, e.model, e.dim, e.created_at, e.vector_json, {recorded_hash}, t.text
+        FROM text_chunk_embeddings e
+        LEFT JOIN text_chunks t ON t.id = e.chunk_id
+    """).fetchall()
+    records, cache = _vector_json_rows(rows)
+
+    c.executemany(
+        "INSERT OR IGNORE INTO embedding_cache (text_hash, model, dim, vector) VALUES (?, ?, ?, ?)", cache
+    )
+    c.execute(TEXT_CHUNK_EMBEDDINGS.format(table="text_chunk_embeddings_new"))
+    c.executemany("""
+        INSERT INTO text_chunk_embeddings_new (chunk_id, model, dim, text_hash, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, records)
+    c.execute("DROP TABLE text_chunk_embeddings")
+    c.execute("ALTER TABLE text_chunk_embeddings_new RENAME TO text_chunk_embeddings")
+    print(f"{len(cache)} vecteurs JSON migrés vers embedding_cache (float32)")
+
 def init_db():
     os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
 
@@ -21,9 +81,11 @@ def init_db():
             file_hash TEXT UNIQUE,
             nb_pages INTEGER,
             date_publication TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duplicate_of INTEGER           -- near-duplicate of this file (processing/dedup.py), NULL if canonical
         )
     ''')
+    _ensure_column(c, "files", "duplicate_of", "INTEGER")
 
     # Projects table 
     c.execute('''
@@ -65,20 +127,41 @@ def init_db():
             content TEXT,
             synthese TEXT,
             avis_detaille TEXT,
+            content_hash TEXT,             -- sha1 of the stripped content (chunking reuses text_sections when equal)
+            content_start INTEGER,         -- offset of the stripped content (leading whitespace length)
             FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE RESTRICT
         )
     ''')
+    _ensure_column(c, "extracted_texts", "content_hash", "TEXT")
+    _ensure_column(c, "extracted_texts", "content_start", "INTEGER")
 
-    # Recommendations 
+    # Text_sections: section boundaries inside extracted_texts.content
+    # (content[start_offset:end_offset] is the section; the conclusion lies inside the avis détaillé)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS text_sections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            extracted_text_id INTEGER NOT NULL,
+            section TEXT CHECK (section IN ('synthese', 'avis_detaille', 'conclusion')),
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            heading TEXT,                  -- heading as found in the text
+            FOREIGN KEY (extracted_text_id) REFERENCES extracted_texts(id) ON DELETE CASCADE
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sections_text ON text_sections(extracted_text_id)")
+
+    # Recommendations
     c.execute('''
         CREATE TABLE IF NOT EXISTS recommendations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             file_id INTEGER,
             recommandation_index INTEGER,
             recommandation_text TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT 'csv' CHECK (source IN ('csv', 'auto')),  -- csv: curated, auto: processing/extract_recommendations.py
             FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
         )
     ''')
+    _ensure_column(c, "recommendations", "source", "TEXT NOT NULL DEFAULT 'csv' CHECK (source IN ('csv', 'auto'))")
     c.execute("CREATE INDEX IF NOT EXISTS idx_recom_file ON recommendations(file_id)")
     c.execute("CREATE INDEX IF NOT EXISTS idx_recom_order ON recommendations(file_id, recommandation_index)")
 
@@ -124,6 +207,26 @@ def init_db():
         END;
     ''')
 
+    # Recommendation_alignments: best-matching passage of the paired réponse for each recommendation
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_alignments (
+            recommendation_id INTEGER NOT NULL,
+            reponse_id INTEGER NOT NULL,
+            project_id INTEGER,
+            model TEXT NOT NULL,
+            score REAL NOT NULL,            -- cosine similarity of the best paragraph
+            start_offset INTEGER,           -- span of the paragraph in the réponse text
+            end_offset INTEGER,
+            matched_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (recommendation_id, reponse_id),
+            FOREIGN KEY (recommendation_id) REFERENCES recommendations(id) ON DELETE CASCADE,
+            FOREIGN KEY (reponse_id) REFERENCES files(id) ON DELETE CASCADE,
+            FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE SET NULL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_align_project ON recommendation_alignments(project_id)")
+
     # Thematiques
     c.execute('''
         CREATE TABLE IF NOT EXISTS thematiques (
@@ -157,26 +260,54 @@ def init_db():
             words INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             file_id INTEGER REFERENCES files(id),
+            duplicate_of INTEGER,          -- near-duplicate of this chunk (processing/dedup.py), NULL if canonical
+            quality_score REAL,            -- processing/quality.py
+            low_quality INTEGER DEFAULT 0, -- 1: OCR noise, not indexed
             FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE SET NULL
         )
     ''')
+    _ensure_column(c, "text_chunks", "duplicate_of", "INTEGER")
+    _ensure_column(c, "text_chunks", "quality_score", "REAL")
+    _ensure_column(c, "text_chunks", "low_quality", "INTEGER DEFAULT 0")
 
     # Indexes for faster search
     c.execute("CREATE INDEX IF NOT EXISTS idx_chunks_project ON text_chunks(project_id)")
     c.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file ON text_chunks(file_id)")
     c.execute("CREATE INDEX IF NOT EXISTS idx_chunks_order ON text_chunks(file_id, chunk_index)")
 
-    # Embeddings table 
+    # Chunk_sources: content hash of the TXT each file was chunked from (incremental re-chunking)
     c.execute('''
-        CREATE TABLE IF NOT EXISTS text_chunk_embeddings (
-            chunk_id INTEGER PRIMARY KEY,
+        CREATE TABLE IF NOT EXISTS chunk_sources (
+            file_id INTEGER PRIMARY KEY,
+            txt_path TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            params_key TEXT NOT NULL,      -- chunker version + chunk size/overlap (JSON)
+            nb_chunks INTEGER,
+            project_id INTEGER,            -- project the chunks were tagged with (re-tagged when the file moves)
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+        )
+    ''')
+    _ensure_column(c, "chunk_sources", "project_id", "INTEGER")
+
+    # Embedding cache: float32 vectors keyed by (text hash, model), see utils/embedding_cache.py
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            text_hash TEXT NOT NULL,       -- sha1 of the embedded text
             model TEXT NOT NULL,
             dim INTEGER NOT NULL,
-            vector_json TEXT NOT NULL,
+            vector BLOB NOT NULL,          -- little-endian float32, dim * 4 bytes
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (chunk_id) REFERENCES text_chunks(id) ON DELETE CASCADE
+            PRIMARY KEY (text_hash, model)
         )
     ''')
+
+    # Embeddings table: which chunk is indexed in Chroma, with which model and text (vectors in embedding_cache)
+    columns = {row[1] for row in c.execute("PRAGMA table_info(text_chunk_embeddings)")}
+    if "vector_json" in columns:
+        _migrate_vector_json(c, columns)
+    c.execute(TEXT_CHUNK_EMBEDDINGS.format(table="text_chunk_embeddings"))
+    _ensure_column(c, "text_chunk_embeddings", "meta_hash", "TEXT")
     c.execute("CREATE INDEX IF NOT EXISTS idx_embed_model ON text_chunk_embeddings(model)")
 
     # FTS5 virtual table for keyword search - CHUNKS
@@ -198,8 +329,11 @@ def init_db():
             INSERT INTO text_chunks_fts(text_chunks_fts, rowid, text) VALUES('delete', old.id, old.text);
         END;
     ''')
+    # Only when the text changes: flag updates (duplicate_of, quality) leave the FTS row alone.
+    # Dropped first so that databases created with the former "AFTER UPDATE" trigger get this one.
+    c.execute("DROP TRIGGER IF EXISTS text_chunks_au")
     c.execute('''
-        CREATE TRIGGER IF NOT EXISTS text_chunks_au AFTER UPDATE ON text_chunks
+        CREATE TRIGGER text_chunks_au AFTER UPDATE OF text ON text_chunks
         BEGIN
             INSERT INTO text_chunks_fts(text_chunks_fts, rowid, text) VALUES('delete', old.id, old.text);
             INSERT INTO text_chunks_fts(rowid, text) VALUES (new.id, new.text);
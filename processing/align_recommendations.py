@@ -0,0 +1,231 @@
+import os
+import re
+import csv
+import time
+import argparse
+import numpy as np
+
+from database import database_manager
+
+# Recommendation <-> réponse alignment over the couples table (avis_id, reponse_id):
+# every recommendation of the avis is compared with every paragraph of the mémoire en réponse.
+# Texts are embedded once per batch of couples, then each couple is one matrix product
+# (normalized vectors: cosine similarity) and an argmax per recommendation.
+# Results (best paragraph and its score) go to recommendation_alignments; the "taux de prise
+# en compte" applies the threshold to the stored scores when it is computed, so changing the
+# threshold does not require re-aligning.
+MODEL_NAME = "intfloat/multilingual-e5-base"
+# e5 models are trained with these prefixes: recommendations are the queries, réponse paragraphs the passages
+QUERY_PREFIX = "query: "
+PASSAGE_PREFIX = "passage: "
+EMBED_BATCH = 64           # texts per forward pass
+COUPLES_PER_BATCH = 32     # couples whose texts are embedded together
+# Best-match cosine similarity from which a recommendation counts as addressed. e5 puts even
+# unrelated pairs around 0.7-0.8, so this default is only a starting point: calibrate it on
+# couples annotated by the analysts with --calibrate (threshold maximizing F1).
+ADDRESSED_MIN_SCORE = 0.85
+PARAGRAPH_MAX_CHARS = 1200
+PARAGRAPH_MIN_CHARS = 40
+REPONSE_TXT_DIR = os.path.join("data", "reponse_txt")
+
+PARAGRAPH_BREAK_RE = re.compile(r"\n\s*\n")
+SENTENCE_BREAK_RE = re.compile(r"[.!?;]\s+")
+
+
+def detect_device():
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+def get_embedder(model_name=MODEL_NAME, batch_size=EMBED_BATCH):
+    """Callable texts -> (n, dim) float32 array of L2-normalized embeddings."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": detect_device()},
+        encode_kwargs={"normalize_embeddings": True, "batch_size": batch_size},
+    )
+
+    def embed(texts):
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(embeddings.embed_documents(list(texts)), dtype=np.float32)
+
+    return embed
+
+
+def split_paragraphs(text, max_chars=PARAGRAPH_MAX_CHARS, min_chars=PARAGRAPH_MIN_CHARS):
+    """
+    (start, end) spans of the paragraphs of `text`. Paragraphs longer than max_chars
+    (or texts without blank lines) are cut into windows of whole sentences.
+    """
+    spans = []
+    start = 0
+    for brk in list(PARAGRAPH_BREAK_RE.finditer(text)) + [None]:
+        end = brk.start() if brk else len(text)
+        if end - start <= max_chars:
+            spans.append((start, end))
+        else:
+            # Greedy windows of whole sentences
+            window_start = start
+            last_cut = None
+            for sentence in SENTENCE_BREAK_RE.finditer(text, start, end):
+                if sentence.end() - window_start > max_chars and last_cut is not None:
+                    spans.append((window_start, last_cut))
+                    window_start = last_cut
+                last_cut = sentence.end()
+            spans.append((window_start, end))
+        start = brk.end() if brk else len(text)
+
+    result = []
+    for s, e in spans:
+        stripped = text[s:e]
+        s, e = s + len(stripped) - len(stripped.lstrip()), e - (len(stripped) - len(stripped.rstrip()))
+        if e - s >= min_chars:
+            result.append((s, e))
+    return result
+
+
+def best_matches(reco_vectors, paragraph_vectors):
+    """Index and cosine similarity of the best paragraph for each recommendation."""
+    similarity = reco_vectors @ paragraph_vectors.T
+    best = similarity.argmax(axis=1)
+    return best, similarity[np.arange(len(best)), best]
+
+
+def load_response_texts(conn, reponse_ids, txt_dir=REPONSE_TXT_DIR):
+    """Latest extracted content of each réponse, falling back to <txt_dir>/<file stem>.txt."""
+    texts = {}
+    for file_id in reponse_ids:
+        row = conn.execute(
+            "SELECT content FROM extracted_texts WHERE file_id = ? ORDER BY id DESC LIMIT 1", (file_id,)
+        ).fetchone()
+        if row and row["content"]:
+            texts[file_id] = row["content"]
+            continue
+        row = conn.execute("SELECT file_name FROM files WHERE id = ?", (file_id,)).fetchone()
+        if row and row["file_name"]:
+            txt_path = os.path.join(txt_dir, os.path.splitext(row["file_name"])[0] + ".txt")
+            if os.path.exists(txt_path):
+                with open(txt_path, "r", encoding="utf-8", errors="ignore") as f:
+                    texts[file_id] = f.read()
+    return texts
+
+
+def align_couples(couples, recommendations, responses, embed, model_name=MODEL_NAME):
+    """
+    couples: [(project_id, avis_id, reponse_id)]; recommendations: {avis_id: [(reco_id, text)]};
+    responses: {reponse_id: text}. Returns recommendation_alignments rows.
+    """
+    paragraphs = {}
+    unique_texts = {}
+    for _, avis_id, reponse_id in couples:
+        for _, reco in recommendations.get(avis_id, []):
+            unique_texts.setdefault(QUERY_PREFIX + reco, len(unique_texts))
+        if reponse_id in responses and reponse_id not in paragraphs:
+            text = responses[reponse_id]
+            paragraphs[reponse_id] = split_paragraphs(text)
+            for s, e in paragraphs[reponse_id]:
+                unique_texts.setdefault(PASSAGE_PREFIX + text[s:e], len(unique_texts))
+
+    # One embedding pass for every distinct text of the batch
+    vectors = embed(list(unique_texts))
+
+    rows = []
+    for project_id, avis_id, reponse_id in couples:
+        recos = recommendations.get(avis_id, [])
+        spans = paragraphs.get(reponse_id, [])
+        if not recos or not spans:
+            continue
+        text = responses[reponse_id]
+        reco_vectors = vectors[[unique_texts[QUERY_PREFIX + reco] for _, reco in recos]]
+        paragraph_vectors = vectors[[unique_texts[PASSAGE_PREFIX + text[s:e]] for s, e in spans]]
+        best, scores = best_matches(reco_vectors, paragraph_vectors)
+        for (reco_id, _), idx, score in zip(recos, best, scores):
+            s, e = spans[idx]
+            rows.append((reco_id, reponse_id, project_id, model_name, float(score), s, e, text[s:e]))
+    return rows
+
+
+def align_all_couples(model_name=MODEL_NAME, couples_per_batch=COUPLES_PER_BATCH, embed=None):
+    """Align every couple of the database in one job. Returns (nb_couples, nb_alignments, seconds)."""
+    start_time = time.perf_counter()
+    embed = embed or get_embedder(model_name)
+
+    with database_manager.get_connection() as conn:
+        couples = [tuple(r) for r in conn.execute("SELECT project_id, avis_id, reponse_id FROM couples")]
+        recommendations = {}
+        for row in conn.execute(
+            "SELECT id, file_id, recommandation_text FROM recommendations ORDER BY file_id, recommandation_index"
+        ):
+            recommendations.setdefault(row["file_id"], []).append((row["id"], row["recommandation_text"]))
+    print(f"{len(couples)} couples, {sum(len(v) for v in recommendations.values())} recommandations")
+
+    nb_rows = 0
+    for i in range(0, len(couples), couples_per_batch):
+        batch = couples[i:i + couples_per_batch]
+        # Réponse texts are loaded per batch: memory does not grow with the corpus
+        with database_manager.get_connection() as conn:
+            responses = load_response_texts(conn, {c[2] for c in batch})
+        rows = align_couples(batch, recommendations, responses, embed, model_name)
+        database_manager.replace_alignments([(c[1], c[2]) for c in batch], rows)
+        nb_rows += len(rows)
+        print(f"Couples {i + len(batch)}/{len(couples)} : {nb_rows} alignements")
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    print(f"Terminé : {len(couples)} couples en {elapsed:.1f}s ({len(couples) / elapsed:.2f} couples/s)")
+    return len(couples), nb_rows, elapsed
+
+
+def calibrate_threshold(labels_csv):
+    """
+    Threshold maximizing F1 on annotated couples. `labels_csv` has the columns
+    recommendation_id, reponse_id, addressed (1/0), for alignments already in the database.
+    Returns (threshold, f1, nb_labels).
+    """
+    with open(labels_csv, newline="", encoding="utf-8") as f:
+        labels = {(int(r["recommendation_id"]), int(r["reponse_id"])): int(r["addressed"]) for r in csv.DictReader(f)}
+    with database_manager.get_connection() as conn:
+        scores = {
+            (r["recommendation_id"], r["reponse_id"]): r["score"]
+            for r in conn.execute("SELECT recommendation_id, reponse_id, score FROM recommendation_alignments")
+        }
+    pairs = [(scores[key], label) for key, label in labels.items() if key in scores]
+    if not pairs:
+        raise ValueError(f"No alignment of the database matches the couples of {labels_csv}")
+
+    best = (ADDRESSED_MIN_SCORE, -1.0)
+    nb_positive = sum(label for _, label in pairs)
+    for threshold in sorted({score for score, _ in pairs}):
+        predicted = [(score >= threshold, label) for score, label in pairs]
+        tp = sum(1 for p, label in predicted if p and label)
+        nb_predicted = sum(1 for p, _ in predicted if p)
+        f1 = 2 * tp / (nb_predicted + nb_positive) if nb_predicted + nb_positive else 0.0
+        if f1 > best[1]:
+            best = (threshold, f1)
+    return best[0], best[1], len(pairs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alignement recommandations <-> réponse pour tous les couples")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--min-score", type=float, default=ADDRESSED_MIN_SCORE,
+                        help="Similarité minimale pour considérer une recommandation prise en compte")
+    parser.add_argument("--couples-per-batch", type=int, default=COUPLES_PER_BATCH)
+    parser.add_argument("--calibrate", metavar="LABELS_CSV",
+                        help="Choisir le seuil sur des couples annotés (recommendation_id, reponse_id, addressed) "
+                             "au lieu d'aligner")
+    args = parser.parse_args()
+
+    min_score = args.min_score
+    if args.calibrate:
+        min_score, f1, nb_labels = calibrate_threshold(args.calibrate)
+        print(f"Seuil calibré sur {nb_labels} couples annotés : {min_score:.3f} (F1 = {f1:.2f})")
+    else:
+        align_all_couples(args.model, args.couples_per_batch)
+    for row in database_manager.get_taux_prise_en_compte(min_score):
+        print(f"Projet {row['project_id']} : {row['nb_prises_en_compte']}/{row['nb_recommandations']} "
+              f"({row['taux_prise_en_compte']:.0%}, seuil {min_score})")
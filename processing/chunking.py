@@ -0,0 +1,110 @@
+import re
+import bisect
+
+# Chunkers used by scripts/build_text_chunks_from_txt.py. Both return, for each text,
+# a list of (start, end, n_tokens) character spans (n_tokens is None when not measured).
+# - "tokens": spans packed up to a token budget of the embedding model's own (fast) tokenizer,
+#             cut at sentence boundaries, with a token overlap. Nothing is truncated by the model
+#             and chunks are as dense as the 512-token window allows.
+# - "chars":  historical RecursiveCharacterTextSplitter (800 characters, 100 overlap).
+CHUNKERS = ("tokens", "chars")
+MODEL_NAME = "intfloat/multilingual-e5-base"
+MODEL_MAX_TOKENS = 512
+CHUNK_TOKENS = MODEL_MAX_TOKENS - 12   # room for <s></s> (chunks are embedded without an e5 prefix)
+CHUNK_OVERLAP_TOKENS = 50
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+
+# Preferred cut points: end of sentence, blank line or line break
+BOUNDARY_RE = re.compile(r"[.!?;:]\s+|\n\s*\n|\n")
+
+
+def pack_tokens(text, offsets, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Greedy packing of a tokenized text. `offsets` are the (start, end) character offsets of
+    its tokens. Each chunk ends at the last boundary of its second half (else at the budget)
+    and the next one starts at the first boundary of the overlap window (else overlap_tokens back).
+    """
+    n = len(offsets)
+    if n == 0:
+        return []
+    token_starts = [start for start, _ in offsets]
+    # Boundaries as token indexes: first token starting after the separator
+    cuts = sorted({bisect.bisect_left(token_starts, m.end()) for m in BOUNDARY_RE.finditer(text)})
+
+    spans = []
+    i = 0
+    while i < n:
+        j = min(i + chunk_tokens, n)
+        if j < n:
+            k = bisect.bisect_right(cuts, j) - 1
+            if k >= 0 and cuts[k] > i + chunk_tokens // 2:
+                j = cuts[k]
+        spans.append((offsets[i][0], offsets[j - 1][1], j - i))
+        if j >= n:
+            break
+        k = bisect.bisect_left(cuts, j - overlap_tokens)
+        next_i = cuts[k] if k < len(cuts) and cuts[k] < j else j - overlap_tokens
+        i = max(next_i, i + 1)
+    return spans
+
+
+class TokenChunker:
+    name = "tokens"
+
+    def __init__(self, model_name=MODEL_NAME, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+        try:
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("The 'tokens' chunker requires `pip install transformers`") from e
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        if not self.tokenizer.is_fast:
+            raise ValueError(f"No fast tokenizer for {model_name} (character offsets are needed)")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.params = {"chunker": self.name, "model": model_name,
+                       "chunk_tokens": chunk_tokens, "overlap_tokens": overlap_tokens}
+
+    def split_texts(self, texts):
+        """One batched tokenizer call for all `texts`, then packing per text."""
+        if not texts:
+            return []
+        encoding = self.tokenizer(
+            list(texts), add_special_tokens=False, return_offsets_mapping=True, verbose=False
+        )
+        return [
+            pack_tokens(text, offsets, self.chunk_tokens, self.overlap_tokens)
+            for text, offsets in zip(texts, encoding["offset_mapping"])
+        ]
+
+
+class CharChunker:
+    name = "chars"
+
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.params = {"chunker": self.name, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+
+    def split_texts(self, texts):
+        results = []
+        for text in texts:
+            spans = []
+            position = 0
+            for chunk in self.splitter.split_text(text):
+                # Chunks are substrings in order; with overlap the next one starts after the previous start
+                found = text.find(chunk, position)
+                if found == -1:
+                    continue
+                spans.append((found, found + len(chunk), None))
+                position = found + 1
+            results.append(spans)
+        return results
+
+
+def get_chunker(name="tokens", **kwargs):
+    if name == "tokens":
+        return TokenChunker(**kwargs)
+    elif name == "chars":
+        return CharChunker(**kwargs)
+    raise ValueError(f"Unsupported chunker: {name}")
@@ -1,25 +1,144 @@
 import re
+from collections import Counter
+
+# Cleaning engine: rules are compiled once, character-level substitutions share one
+# table, compatible regexes share one pass and passes that cannot match are skipped.
+# Output is byte-identical to the historical one-re.sub-per-rule functions
+# (see scripts/bench_cleaning.py for the equivalence check and benchmark).
+# Bump CLEANER_VERSION whenever a rule changes the output.
+CLEANER_VERSION = "2"
+
+
+def compile_rule(pattern, repl, flags=0, requires=None):
+    """
+    One cleaning pass. `repl` is a replacement string or a function (for fused patterns).
+    `requires` lists literal substrings the pattern cannot match without: when none of
+    them is in the text the pass is skipped (a substring test is much cheaper than a regex scan).
+    """
+    if isinstance(requires, str):
+        requires = (requires,)
+    return re.compile(pattern, flags), repl, requires
+
+
+def apply_rules(text, rules):
+    for regex, repl, requires in rules:
+        if requires is None or any(literal in text for literal in requires):
+            text = regex.sub(repl, text)
+    return text
+
+
+def translate_chars(text, char_map):
+    # Equivalent to text.translate(str.maketrans(char_map)), but str.translate falls back to a
+    # per-character dict lookup on non-ASCII text (~10x slower than one str.replace per present char)
+    for old, new in char_map.items():
+        if old in text:
+            text = text.replace(old, new)
+    return text
+
+
+# --- Normalization ---------------------------------------------------------
+# Same order as the historical passes: form feeds, then "cid:NN", then ligatures/quotes
+LIGATURES_QUOTES = {"ﬁ": "", "ﬂ": "", "’": "'", "`": "'", "‘": "'"}
+# The historical pattern r'(cid:\d+)' is a group, not literal parentheses
+CID = compile_rule(r'cid:\d+', '', requires="cid:")
+
+
+def _normalize_spaces(match):
+    # [ \t]+ -> ' ' and \n\s*\n -> '\n\n' in one pass; single spaces are left alone
+    return "\n\n" if match.group()[0] == "\n" else " "
+
+
+NORMALIZE_SPACES = compile_rule(r'\n\s*\n| [ \t]+|\t[ \t]*', _normalize_spaces, requires=("\n", "  ", "\t"))
+
 
 def normalize_text(text: str) -> str:
     text = text.replace('\x0c', '')
-    text = re.sub(r'(cid:\d+)', '', text)
-    text = re.sub(r'[ﬁﬂ]', '', text)
-    text = re.sub(r"[’`‘]", "'", text)
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = apply_rules(text, [CID])
+    text = translate_chars(text, LIGATURES_QUOTES)
+    text = apply_rules(text, [NORMALIZE_SPACES])
     return text.strip()
 
 
+# --- Cleaning --------------------------------------------------------------
+def _collapse_spaces(match):
+    # [ \t]+ -> ' ' and \n{2,} -> '\n\n' in one pass; single spaces and "\n\n" are left alone
+    return "\n\n" if match.group()[0] == "\n" else " "
+
+
+OCR_PAGE_MARKER = compile_rule(r'--- Page \d+ --- \(OCR\)', '', requires="(OCR)")
+AVIS_DELIBERE_HEADER = compile_rule(
+    r'AVIS D[ÉE]LIB[ÉE]R[ÉE] N[°ºo]\s?\d{4}-\d+.*?région.*?\n?', '', re.IGNORECASE
+)
+
+CLEAN_RULES = [
+    OCR_PAGE_MARKER,
+    compile_rule(r'^[=|_\-\[\]<>\\/#*]{3,}.*$', '', re.MULTILINE),
+    compile_rule(r'\bla \d+/\d+\b', '', re.IGNORECASE, requires="/"),
+    compile_rule(r'^\s*.*\(source\s*:\s*dossier\)\s*$', '', re.MULTILINE, requires="(source"),
+    compile_rule(r'(?<=[a-z,;])\n(?=[a-zéèàù])', ' ', requires="\n"),
+    compile_rule(r'\n?\d{1,2}/\d{1,2}\n?', '', requires="/"),
+    compile_rule(r'\.([^\s])', r'. \1', requires="."),
+    compile_rule(r':([^\s])', r': \1', requires=":"),
+    compile_rule(r' [ \t]+|\t[ \t]*|\n{3,}', _collapse_spaces, requires=("  ", "\t", "\n\n\n")),
+]
+
+# Avis variant (processing/extract_sections_avis.py): also drops the "AVIS DÉLIBÉRÉ N°..." running header
+CLEAN_RULES_AVIS = [OCR_PAGE_MARKER, AVIS_DELIBERE_HEADER] + CLEAN_RULES[1:]
+
+
 def clean_text(text: str) -> str:
-    text = re.sub(r'--- Page \d+ --- \(OCR\)', '', text)
-    text = re.sub(r'^[=|_\-\[\]<>\\/#*]{3,}.*$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\bla \d+/\d+\b', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^\s*.*\(source\s*:\s*dossier\)\s*$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'(?<=[a-z,;])\n(?=[a-zéèàù])', ' ', text)
-    text = re.sub(r'\n?\d{1,2}/\d{1,2}\n?', '', text)
-    text = re.sub(r'\.([^\s])', r'. \1', text)
-    text = re.sub(r':([^\s])', r': \1', text)
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n{2,}', '\n\n', text)
-    return text.strip()
+    return apply_rules(text, CLEAN_RULES).strip()
+
+
+# --- Page furniture ----------------------------------------------------------
+# Running headers/footers that the fixed rules above miss (regional banners, "Page 3 sur 20", ...):
+# lines found at the top or bottom of most pages of a document. Pages are delimited by the
+# "--- Page N ---" markers written by processing/extract_text.py, so this runs on raw extractions.
+PAGE_MARKER_RE = re.compile(r'^--- Page \d+ ---.*$', re.MULTILINE)
+FURNITURE_ZONE_LINES = 3         # non-empty lines considered at the top and at the bottom of a page
+FURNITURE_MIN_PAGE_RATIO = 0.5   # a line is furniture when it is in the zone of at least half the pages
+FURNITURE_MIN_PAGES = 3
+FURNITURE_MAX_CHARS = 200        # longer lines are body text, never furniture
+_DIGITS = re.compile(r'\d+')
+# Page numbers: "page 3", "page 3 sur 20", "page 3/20" anywhere in the line, or a line that is only "3" or "3/20"
+_PAGE_NUMBER = re.compile(r'\bpage\s*\d+(?:\s*(?:sur|/|de)\s*\d+)?\b|^\d+(?:\s*/\s*\d+)?$')
+
+
+def _furniture_key(line):
+    # Page numbers masked so that "Page 3 sur 20" and "Page 4 sur 20" count as the same line;
+    # other digits are kept ("Tableau 3", "12 ha" are content, not furniture)
+    return _PAGE_NUMBER.sub(lambda m: _DIGITS.sub('#', m.group()), " ".join(line.split()).lower())
+
+
+def strip_page_furniture(text, zone_lines=FURNITURE_ZONE_LINES, min_ratio=FURNITURE_MIN_PAGE_RATIO,
+                         min_pages=FURNITURE_MIN_PAGES):
+    """
+    Remove recurring headers/footers with one frequency count over the pages of the document.
+    Returns (text, nb_bytes_removed); the text is returned as is when nothing recurs.
+    """
+    markers = list(PAGE_MARKER_RE.finditer(text))
+    if len(markers) < min_pages:
+        return text, 0
+
+    pages = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        lines = text[marker.end():end].split("\n")
+        non_empty = [j for j, line in enumerate(lines) if line.strip()]
+        zone = {j for j in non_empty[:zone_lines] + non_empty[-zone_lines:] if len(lines[j]) <= FURNITURE_MAX_CHARS}
+        pages.append((marker.group(), lines, zone))
+
+    counts = Counter()
+    for _, lines, zone in pages:
+        counts.update({_furniture_key(lines[j]) for j in zone})
+    threshold = max(min_pages, min_ratio * len(pages))
+    furniture = {key for key, count in counts.items() if count >= threshold}
+    if not furniture:
+        return text, 0
 
+    parts = [text[:markers[0].start()]]
+    for label, lines, zone in pages:
+        kept = [line for j, line in enumerate(lines) if j not in zone or _furniture_key(line) not in furniture]
+        parts.append(label + "\n".join(kept))
+    stripped = "".join(parts)
+    return stripped, len(text.encode("utf-8")) - len(stripped.encode("utf-8"))
@@ -0,0 +1,160 @@
+import re
+import time
+import zlib
+import argparse
+import numpy as np
+
+from database import database_manager
+
+# Near-duplicate elimination before embedding (MinHash + LSH), run between
+# scripts/build_text_chunks_from_txt.py and scripts/index_chroma_from_db.py.
+#
+# - Documents: the same avis received twice under different hashes (re-export, other PDF producer).
+#   Latest extracted text of each file; the duplicate file gets files.duplicate_of = canonical file.
+# - Chunks: MRAe boilerplate (préambule, legal reminders) repeated in every avis.
+#   Chunks of canonical files only; duplicates get text_chunks.duplicate_of = canonical chunk.
+# The canonical copy is the lowest id of each group. Only canonical copies are embedded and indexed.
+# Duplicates are only searched within a project: retrieval filters on project_id, so a copy shared
+# by two projects must stay indexed once in each of them.
+NUM_PERM = 128
+BANDS = 16                  # 16 bands x 8 rows: pairs above ~0.7 Jaccard become candidates
+SHINGLE_WORDS = 5
+DOC_THRESHOLD = 0.9         # estimated Jaccard needed to mark a duplicate
+CHUNK_THRESHOLD = 0.8
+EMBEDDING_DIM = 768         # multilingual-e5-base, float32 in Chroma (for the size report)
+
+_WORDS = re.compile(r"\w+")
+_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1)   # fixed seed: signatures are comparable across runs
+_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    """32-bit hashes of the k-word shingles of `text` (lower-cased, punctuation ignored)."""
+    words = _WORDS.findall(text.lower())
+    if len(words) < k:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.fromiter({zlib.crc32(g.encode("utf-8")) for g in grams}, dtype=np.uint64)
+
+
+def minhash(hashes):
+    """MinHash signature (NUM_PERM values); None for an empty shingle set."""
+    if len(hashes) == 0:
+        return None
+    # (a * h + b) mod p for every permutation at once; a, h < 2^32 so the product fits in uint64
+    return ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def find_duplicates(items, threshold, bands=BANDS):
+    """
+    `items` [(id, scope, signature)] -> {duplicate_id: canonical_id}. Candidates share their scope
+    (project) and at least one LSH band; a pair is kept when its signatures agree on `threshold`
+    of the permutations.
+    """
+    rows = NUM_PERM // bands
+    parent = {}
+
+    def root(x):
+        while parent.get(x, x) != x:
+            x = parent[x]
+        return x
+
+    buckets = {}
+    for item_id, scope, signature in items:
+        for band in range(bands):
+            key = (scope, band, signature[band * rows:(band + 1) * rows].tobytes())
+            buckets.setdefault(key, []).append((item_id, signature))
+
+    checked = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        # Each member is compared with the bucket's leaders (members that matched no earlier
+        # leader), not with every other member: boilerplate buckets hold thousands of chunks
+        leaders = [members[0]]
+        for other_id, other_sig in members[1:]:
+            for leader_id, leader_sig in leaders:
+                pair = (leader_id, other_id)
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                if np.mean(leader_sig == other_sig) >= threshold:
+                    a, b = root(leader_id), root(other_id)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+                    break
+            else:
+                leaders.append((other_id, other_sig))
+
+    return {item_id: root(item_id) for item_id in parent if root(item_id) != item_id}
+
+
+def dedup_documents(threshold=DOC_THRESHOLD):
+    with database_manager.get_connection() as conn:
+        rows = conn.execute("""
+            SELECT e.file_id, (SELECT MIN(pf.project_id) FROM project_files pf WHERE pf.file_id = e.file_id), e.content
+            FROM extracted_texts e
+            JOIN (SELECT file_id, MAX(id) AS id FROM extracted_texts GROUP BY file_id) latest ON latest.id = e.id
+            WHERE e.content IS NOT NULL
+        """).fetchall()
+    items = []
+    for file_id, project_id, content in rows:
+        signature = minhash(shingles(content))
+        if signature is not None:
+            items.append((file_id, project_id, signature))
+    return find_duplicates(items, threshold)
+
+
+def dedup_chunks(duplicate_files, threshold=CHUNK_THRESHOLD):
+    """
+    Chunk duplicates among the chunks of canonical files, within each project.
+    Returns (duplicates, chunks of duplicate files, {chunk_id: tokens}) for the report.
+    """
+    with database_manager.get_connection() as conn:
+        rows = conn.execute("SELECT id, project_id, file_id, text, tokens_est FROM text_chunks ORDER BY id").fetchall()
+    items = []
+    in_duplicate_files = set()
+    tokens = {}
+    for chunk_id, project_id, file_id, text, tokens_est in rows:
+        tokens[chunk_id] = tokens_est or len(text) // 4
+        if file_id in duplicate_files:
+            in_duplicate_files.add(chunk_id)
+            continue
+        signature = minhash(shingles(text))
+        if signature is not None:
+            items.append((chunk_id, project_id, signature))
+    return find_duplicates(items, threshold), in_duplicate_files, tokens
+
+
+def main(doc_threshold=DOC_THRESHOLD, chunk_threshold=CHUNK_THRESHOLD):
+    start_time = time.perf_counter()
+    duplicate_files = dedup_documents(doc_threshold)
+    duplicate_chunks, chunks_of_duplicate_files, tokens = dedup_chunks(duplicate_files, chunk_threshold)
+    elapsed = time.perf_counter() - start_time
+
+    database_manager.replace_duplicates("files", duplicate_files)
+    database_manager.replace_duplicates("text_chunks", duplicate_chunks)
+
+    # Report: what the indexer will not embed (duplicate chunks + every chunk of a duplicate file)
+    skipped = chunks_of_duplicate_files | set(duplicate_chunks)
+    total_tokens = sum(tokens.values()) or 1
+    skipped_tokens = sum(tokens[chunk_id] for chunk_id in skipped)
+    vector_bytes = len(skipped) * EMBEDDING_DIM * 4
+    print(f"Documents en double : {len(duplicate_files)} (seuil {doc_threshold})")
+    print(f"Chunks en double : {len(duplicate_chunks)} (seuil {chunk_threshold})"
+          f" + {len(chunks_of_duplicate_files)} chunks de documents en double")
+    print(f"Chunks non embeddés : {len(skipped)}/{len(tokens)} ({len(skipped) / max(len(tokens), 1):.1%})"
+          f" | index Chroma : -{vector_bytes / 1e6:.1f} Mo de vecteurs"
+          f" | temps d'embedding : ~-{skipped_tokens / total_tokens:.1%} (tokens)")
+    print(f"Déduplication en {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Marquage des documents et chunks quasi-dupliqués (MinHash/LSH)")
+    parser.add_argument("--doc-threshold", type=float, default=DOC_THRESHOLD)
+    parser.add_argument("--chunk-threshold", type=float, default=CHUNK_THRESHOLD)
+    args = parser.parse_args()
+    main(doc_threshold=args.doc_threshold, chunk_threshold=args.chunk_threshold)
@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from processing.extract_sections_avis import find_section_offsets
+from database import database_manager
+
+# Batch extraction of the Ae/MRAe recommendations from cleaned avis (data/avis_cleaned/*_cleaned.txt)
+# into the recommendations table (+ recommendations_fts through its triggers).
+#
+# A recommendation is the sentence holding "L'Ae / l'autorité environnementale / la MRAe recommande...",
+# or a numbered "Recommandation n°3 : ..." block, up to the end of the sentence (bullet lists included).
+# Only the avis détaillé is scanned when present: the synthèse restates the same recommendations.
+AUTHORITY = (
+    r"(?:l['’]\s?(?:autorit[ée]\s+environnementale|Ae\b|AE\b|MRAe\b|MRAE\b)"
+    r"|la\s+(?:MRAe|MRAE)\b"
+    r"|la\s+mission\s+r[ée]gionale\s+d['’]\s?autorit[ée]\s+environnementale)"
+)
+TRIGGER_RE = re.compile(
+    AUTHORITY + r"\s+(?:recommande|recommandent)\b"
+    r"|(?:^|(?<=\s))Recommandation\s*(?:n\s?[°o]\s*)?\d+\s*[:.\-–]",
+    re.IGNORECASE,
+)
+# Abbreviations whose period does not end a sentence ("article R. 122-5", "L. 122-1", "p. 12", "cf. ...")
+ABBREVIATIONS = ("art", "cf", "p", "pp", "al", "ex", "fig", "chap", "réf", "n°")
+# Period that is not an abbreviation's: none of the words above, nor a single capital letter (R., L., D.)
+_PERIOD = "".join(rf"(?<!\b(?i:{re.escape(a)}))" for a in ABBREVIATIONS) + r"(?<!\b[A-Z])\."
+# End of sentence: a period followed by an upper-case start, a numbered heading or the end of the text
+SENTENCE_END_RE = re.compile(rf"(?:{_PERIOD}|[!?])(?=\s+[A-ZÉÈÊÀÂÎÔÛÇ«\d]|\s*$)")
+# Start of sentence: after a sentence end, a line break or a running "Page 10 sur 20" header
+SENTENCE_START_RE = re.compile(rf"(?:{_PERIOD}|[!?])\s+|\n|\b[Pp]age\s+\d+\s*(?:sur|/)\s*\d+\s+")
+
+MAX_LOOKBACK = 400       # characters searched backwards for the start of the sentence
+MAX_RECO_CHARS = 3000    # a runaway sentence (no final period) is cut here
+MIN_RECO_CHARS = 30
+CHUNKSIZE = 16           # files handed to each worker at a time
+INSERT_BATCH = 500       # files per delete+insert transaction
+
+
+def _sentence_start(text, pos, lower_bound):
+    window_start = max(lower_bound, pos - MAX_LOOKBACK)
+    best = None
+    for best in SENTENCE_START_RE.finditer(text, window_start, pos):
+        pass
+    if best is not None:
+        return best.end()
+    # No boundary: start of the scanned section, or a sentence too long to look back that far
+    return window_start if window_start == lower_bound else pos
+
+
+def extract_recommendations(text, start=0, end=None):
+    """
+    Recommendation sentences found in text[start:end], in order, whitespace-normalized and deduplicated.
+
+    >>> extract_recommendations("L'Ae recommande de compléter l'étude d'impact au titre de l'article "
+    ...                         "R. 122-5 du code de l'environnement (cf. p. 12). Le projet est situé en zone N.")
+    ["L'Ae recommande de compléter l'étude d'impact au titre de l'article R. 122-5 du code de l'environnement (cf. p. 12)."]
+    """
+    end = len(text) if end is None else end
+    recommendations = []
+    seen = set()
+    last_end = start
+    for match in TRIGGER_RE.finditer(text, start, end):
+        if match.start() < last_end:
+            # Second trigger inside an already extracted sentence
+            continue
+        if match.group().lower().startswith("recommandation"):
+            reco_start = match.start()
+        else:
+            reco_start = max(_sentence_start(text, match.start(), start), last_end)
+        stop = SENTENCE_END_RE.search(text, match.end(), min(end, match.end() + MAX_RECO_CHARS))
+        reco_end = stop.end() if stop else min(end, match.end() + MAX_RECO_CHARS)
+        last_end = reco_end
+
+        reco = " ".join(text[reco_start:reco_end].split())
+        if len(reco) >= MIN_RECO_CHARS and reco.lower() not in seen:
+            seen.add(reco.lower())
+            recommendations.append(reco)
+    return recommendations
+
+
+def extract_recommendations_file(txt_path):
+    """Worker: read one cleaned avis, return (txt_path, [recommendations])."""
+    with open(txt_path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if "ecommand" not in text:
+        return txt_path, []
+    start, end = 0, len(text)
+    for section, s, e, _ in find_section_offsets(text):
+        if section == "avis_detaille":
+            start, end = s, e
+    return txt_path, extract_recommendations(text, start, end)
+
+
+def pdf_name_for(txt_path):
+    """data/avis_cleaned/0001_cleaned.txt -> 0001.pdf (files.file_name)"""
+    stem = Path(txt_path).stem
+    if stem.endswith("_cleaned"):
+        stem = stem[: -len("_cleaned")]
+    return stem + ".pdf"
+
+
+def process_cleaned_folder(input_dir, workers=None, chunksize=CHUNKSIZE):
+    """
+    Extract the recommendations of every *.txt in `input_dir` and replace the extracted ones of
+    the matching files (files.file_name = <stem>.pdf) in the database. Files with curated
+    recommendations (CSV import) and files where nothing was found are left untouched.
+    Returns (nb_files, nb_recommendations, seconds).
+    """
+    start_time = time.perf_counter()
+    txt_files = sorted(str(p) for p in Path(input_dir).glob("*.txt"))
+    print(f"Dossier : {input_dir} ({len(txt_files)} fichiers)")
+
+    with database_manager.get_connection() as conn:
+        file_ids = {row["file_name"]: row["id"] for row in conn.execute("SELECT id, file_name FROM files")}
+    curated = database_manager.get_curated_recommendation_files()
+
+    nb_files, nb_recos, nb_curated, nb_empty = 0, 0, 0, 0
+    batch = {}
+
+    def flush():
+        nonlocal nb_recos
+        rows = [(file_id, i, reco) for file_id, recos in batch.items() for i, reco in enumerate(recos, 1)]
+        database_manager.replace_recommendations(list(batch), rows)
+        nb_recos += len(rows)
+        batch.clear()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for txt_path, recos in pool.map(extract_recommendations_file, txt_files, chunksize=chunksize):
+            file_id = file_ids.get(pdf_name_for(txt_path))
+            if file_id is None:
+                print(f"Aucun file_id pour '{os.path.basename(txt_path)}' (attendu '{pdf_name_for(txt_path)}')")
+                continue
+            nb_files += 1
+            if file_id in curated:
+                nb_curated += 1
+                continue
+            if not recos:
+                # Nothing found (or no "recommand" at all): keep what the database already has
+                nb_empty += 1
+                continue
+            batch[file_id] = recos
+            if len(batch) >= INSERT_BATCH:
+                flush()
+    if batch:
+        flush()
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    print(f"{nb_files} avis, {nb_recos} recommandations en {elapsed:.1f}s ({nb_files / elapsed:.1f} avis/s)")
+    print(f"Ignorés : {nb_curated} avis avec recommandations saisies (CSV), {nb_empty} avis sans recommandation détectée")
+    return nb_files, nb_recos, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extraction des recommandations des avis nettoyés vers la base")
+    parser.add_argument("input_dirs", nargs="*", default=["data/avis_cleaned"])
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Nombre de processus (défaut : nombre de coeurs)")
+    args = parser.parse_args()
+
+    for input_dir in args.input_dirs:
+        process_cleaned_folder(input_dir, workers=args.workers)
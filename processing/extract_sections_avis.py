@@ -1,32 +1,24 @@
 import re
 import os
-import pandas as pd
+import csv
+import shutil
+import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
-# Normalization
-def normalize_text(text):
-    text = text.replace('\x0c', '')  
-    text = re.sub(r'(cid:\d+)', '', text)
-    text = re.sub(r'[ﬁﬂ]', '', text)
-    text = re.sub(r"[’`‘]", "'", text)
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    return text.strip()
+from processing.clean_text import normalize_text, apply_rules, strip_page_furniture, CLEAN_RULES_AVIS, CLEANER_VERSION
+from utils.hashing import hash_files
+from utils import manifest
+
+# Files handed to each worker at a time (small files: amortizes inter-process overhead)
+SECTIONS_CHUNKSIZE = 8
 
-# Cleaning
+# Normalization: shared engine (processing/clean_text.py)
+
+# Cleaning: shared engine, plus the "AVIS DÉLIBÉRÉ N°..." header rule
 def clean_text(text):
-    text = re.sub(r'--- Page \d+ --- \(OCR\)', '', text)
-    text = re.sub(r'AVIS D[ÉE]LIB[ÉE]R[ÉE] N[°ºo]\s?\d{4}-\d+.*?région.*?\n?', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^[=|_\-\[\]<>\\/#*]{3,}.*$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\bla \d+/\d+\b', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^\s*.*\(source\s*:\s*dossier\)\s*$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'(?<=[a-z,;])\n(?=[a-zéèàù])', ' ', text)
-    text = re.sub(r'\n?\d{1,2}/\d{1,2}\n?', '', text)
-    text = re.sub(r'\.([^\s])', r'. \1', text)
-    text = re.sub(r':([^\s])', r': \1', text)
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n{2,}', '\n\n', text)
-    return text.strip()
+    return apply_rules(text, CLEAN_RULES_AVIS).strip()
+
 
 def remove_first_and_last_sentence_synthese(text):
     if not isinstance(text, str):
@@ -41,72 +33,189 @@ def remove_first_and_last_sentence_synthese(text):
     return text.strip()
 
 # Extraction
-def extract_sections(text):
-    text = re.sub(r'\r\n?', '\n', text)
-
-    synthese, avis_detaille, conclusion = None, None, None
-
-    # Synthèse
-    match_synth = re.search(r'synth[èeéê]se de l[’\'`]avis', text, re.IGNORECASE)
+SECTIONS = ("synthese", "avis_detaille", "conclusion")
+SYNTHESE_RE = re.compile(r'synth[èeéê]se de l[’\'`]avis', re.IGNORECASE)
+AVIS_DETAILLE_RE = re.compile(r'^\s*Avis d[éeèéê]taill[éeéèê]', re.IGNORECASE | re.MULTILINE)
+CONCLUSION_RE = re.compile(r'conclusion[\s:\-–]{0,2}\n?(.*)', re.IGNORECASE)
+
+
+def _strip_span(text, start, end):
+    """Offsets of text[start:end].strip() within text."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def find_section_offsets(text):
+    """
+    Section boundaries of a cleaned avis: [(section, start, end, heading)] where
+    text[start:end] is exactly the section returned by extract_sections and heading
+    is the heading found in the text (None when the whole text is the avis détaillé).
+    Empty sections are omitted. The conclusion lies inside the avis détaillé.
+    """
+    spans = []
+    match_synth = SYNTHESE_RE.search(text)
     if match_synth:
-        start = match_synth.start()
-
         # Avis détaillé
-        match_avis = re.search(r'^\s*Avis d[éeèéê]taill[éeéèê]', text, re.IGNORECASE | re.MULTILINE)
+        match_avis = AVIS_DETAILLE_RE.search(text)
         if match_avis:
-            synthese = text[start:match_avis.start()].strip()
-            avis_detaille = text[match_avis.start():].strip()
+            heading = match_avis.group().strip()
+            spans.append(("synthese", match_synth.start(), match_avis.start(), match_synth.group()))
+            spans.append(("avis_detaille", match_avis.start(), len(text), heading))
         else:
-            synthese = text[start:].strip()
-
+            spans.append(("synthese", match_synth.start(), len(text), match_synth.group()))
     else:
-        avis_detaille = text.strip()
+        spans.append(("avis_detaille", 0, len(text), None))
 
-    # Conclusion 
-    match_conclusion = re.search(r'conclusion[\s:\-–]{0,2}\n?(.*)', text, re.IGNORECASE)
+    match_conclusion = CONCLUSION_RE.search(text)
     if match_conclusion:
-        conclusion = match_conclusion.group(1).strip()
+        heading = text[match_conclusion.start():match_conclusion.start(1)].strip()
+        spans.append(("conclusion", match_conclusion.start(1), match_conclusion.end(1), heading))
 
-    return synthese or None, avis_detaille or None, conclusion or None
+    offsets = []
+    for section, start, end, heading in spans:
+        start, end = _strip_span(text, start, end)
+        if start < end:
+            offsets.append((section, start, end, heading))
+    return offsets
 
-# Pipeline
-def process_txt_folder(input_dir, output_dir, output_csv):
-    input_dir = Path(input_dir)
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
 
-    data = []
+def section_at(offsets, position):
+    """Most specific section containing `position` (e.g. a chunk start), or None."""
+    best = None
+    for section, start, end, _ in offsets:
+        if start <= position < end and (best is None or start >= best[1]):
+            best = (section, start)
+    return best[0] if best else None
 
-    for txt_file in input_dir.glob("*.txt"):
-        with open(txt_file, "r", encoding="utf-8", errors="ignore") as f:
+
+def extract_sections(text):
+    text = re.sub(r'\r\n?', '\n', text)
+    sections = {section: text[start:end] for section, start, end, _ in find_section_offsets(text)}
+    return sections.get("synthese"), sections.get("avis_detaille"), sections.get("conclusion")
+
+# Pipeline
+MANIFEST_STAGE = "sections"
+CSV_COLUMNS = ["file_name", "synthese", "avis_detaille", "conclusion"]
+
+
+def sections_row(file_name, cleaned):
+    synthese, avis_detaille, conclusion = extract_sections(cleaned)
+    synthese = remove_first_and_last_sentence_synthese(synthese)
+    return [file_name, synthese, avis_detaille, conclusion]
+
+
+def process_txt_file(txt_path, cleaned_path, reuse_cleaned=False, strip_furniture=True):
+    """
+    Clean one avis and return (CSV row, bytes of page headers/footers removed).
+    With reuse_cleaned=True the existing _cleaned.txt (same source hash and cleaner
+    version) is read instead of re-cleaning.
+    """
+    nb_bytes = 0
+    if reuse_cleaned:
+        with open(cleaned_path, "r", encoding="utf-8") as f:
+            cleaned = f.read()
+    else:
+        with open(txt_path, "r", encoding="utf-8", errors="ignore") as f:
             raw_text = f.read()
 
+        if strip_furniture:
+            raw_text, nb_bytes = strip_page_furniture(raw_text)
         normalized = normalize_text(raw_text)
         cleaned = clean_text(normalized)
 
         # Save cleaned
-        cleaned_path = output_dir / f"{txt_file.stem}_cleaned.txt"
         with open(cleaned_path, "w", encoding="utf-8") as f:
             f.write(cleaned)
 
-        synthese, avis_detaille, conclusion = extract_sections(cleaned)
-        synthese = remove_first_and_last_sentence_synthese(synthese)
-
-        data.append({
-            "file_name": txt_file.name,
-            "synthese": synthese,
-            "avis_detaille": avis_detaille,
-            "conclusion": conclusion
-        })
+    return sections_row(Path(txt_path).name, cleaned), nb_bytes
+
+
+def process_txt_folder(input_dir, output_dir, output_csv, workers=1, manifest_conn=None, force=False,
+                       strip_furniture=True):
+    """
+    Clean every .txt of `input_dir` into `output_dir` and write the sections CSV.
+    Rows are written as soon as they are ready (csv.writer), in listing order,
+    so memory does not grow with the number of avis.
+    With a manifest connection, files whose content hash and CLEANER_VERSION are
+    already recorded are not cleaned again: their sections are re-read from the
+    existing _cleaned.txt (unless force=True).
+    With strip_furniture, recurring page headers/footers are removed before cleaning
+    (processing.clean_text.strip_page_furniture).
+    Returns (nb_cleaned, nb_skipped).
+    """
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
 
-        print(f"Fichier traité : {txt_file.name}")
+    txt_files = sorted(input_dir.glob("*.txt"))
+    params_key = manifest.make_params_key(CLEANER_VERSION, strip_furniture=strip_furniture)
+    hashes = hash_files([str(p) for p in txt_files]) if manifest_conn is not None else {}
 
-    df = pd.DataFrame(data)
-    df.to_csv(output_csv, index=False, encoding="utf-8")
+    jobs = []
+    nb_skipped = 0
+    for txt_file in txt_files:
+        cleaned_path = output_dir / f"{txt_file.stem}_cleaned.txt"
+        reuse = False
+        if manifest_conn is not None and not force:
+            entry = manifest.lookup(manifest_conn, MANIFEST_STAGE, hashes[str(txt_file)], params_key)
+            prev_cleaned = entry["output_path"] if entry else None
+            if prev_cleaned and os.path.exists(prev_cleaned):
+                if os.path.abspath(prev_cleaned) != os.path.abspath(cleaned_path):
+                    # Same content under another name/folder
+                    shutil.copyfile(prev_cleaned, cleaned_path)
+                reuse = True
+                nb_skipped += 1
+        jobs.append((str(txt_file), str(cleaned_path), reuse, strip_furniture))
+
+    if manifest_conn is not None:
+        print(f"{nb_skipped} fichiers inchangés ignorés, {len(jobs) - nb_skipped} à nettoyer")
+
+    total_bytes = 0
+    with open(output_csv, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(CSV_COLUMNS)
+
+        if workers <= 1:
+            rows = (process_txt_file(*job) for job in jobs)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            rows = pool.map(process_txt_file, *zip(*jobs), chunksize=SECTIONS_CHUNKSIZE) if jobs else []
+
+        try:
+            for (txt_path, cleaned_path, reused, _), (row, nb_bytes) in zip(jobs, rows):
+                writer.writerow(row)
+                if manifest_conn is not None and not reused:
+                    manifest.record(manifest_conn, MANIFEST_STAGE, hashes[txt_path], params_key, txt_path, cleaned_path)
+                total_bytes += nb_bytes
+                suffix = f" (en-têtes/pieds de page : -{nb_bytes} octets)" if nb_bytes else ""
+                print(f"Fichier traité : {row[0]}{suffix}")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    if total_bytes:
+        print(f"En-têtes/pieds de page supprimés : {total_bytes / 1e6:.2f} Mo")
     print(f"\n Résultat sauvegardé : {output_csv}")
+    return len(jobs) - nb_skipped, nb_skipped
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nettoyage des avis et extraction des sections vers CSV")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de processus (1 = séquentiel)")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-nettoyer tous les fichiers, même ceux déjà présents dans le manifeste")
+    parser.add_argument("--manifest", default=manifest.MANIFEST_DB)
+    parser.add_argument("--keep-furniture", action="store_true",
+                        help="Ne pas supprimer les en-têtes/pieds de page récurrents")
+    args = parser.parse_args()
+
+    manifest_conn = manifest.open_manifest(args.manifest)
+
     folders = [
         ("data/avis_txt", "data/avis_cleaned", "data/avis_sections.csv"),
         ("data/experimentation_txt/avis_txt", "data/experimentation_avis_cleaned", "data/experimentation_avis_sections.csv")
@@ -114,4 +223,8 @@ if __name__ == "__main__":
 
     for input_dir, output_dir, output_csv in folders:
         print(f"\n Traitement du dossier: {input_dir}")
-        process_txt_folder(input_dir, output_dir, output_csv)
+        process_txt_folder(input_dir, output_dir, output_csv, workers=args.workers,
+                           manifest_conn=manifest_conn, force=args.full,
+                           strip_furniture=not args.keep_furniture)
+
+    manifest_conn.close()
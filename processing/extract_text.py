@@ -1,34 +1,436 @@
 import os
-import pdfplumber
-import pytesseract
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pdf2image import convert_from_path
+from utils.hashing import compute_file_hash
+from utils import ocr_cache as page_cache
+from processing.ocr_engine import get_engine, OcrResult, OCR_ENGINES
+from processing.text_backends import open_text_backend, TEXT_BACKENDS
+from processing.preprocess import preprocess_page
 
-def extract_text_with_hybrid_mode(pdf_path, cutoff_ratio=0.85):
+# Bump when a change alters the extracted text, so incremental runs re-extract
+EXTRACTOR_VERSION = "2"
+
+# Number of pages rasterized at once. Peak memory is bounded by this window,
+# not by the number of pages in the document. None renders the whole PDF up front.
+PAGE_WINDOW = 4
+
+# OCR modes:
+# - "always": OCR every page and keep the longer text (historical behaviour)
+# - "gate":   score the pdfplumber text layer first and only OCR pages below the thresholds
+# - "regions": OCR only the embedded images of each page and merge them with the text layer
+OCR_MODES = ("always", "gate", "regions")
+GATE_MIN_CHARS = 100          # non-space characters in the text layer
+GATE_MIN_LETTER_RATIO = 0.6   # letters / non-space characters
+GATE_MAX_CID_RATIO = 0.05     # share of characters coming from "(cid:NN)" glyph fallbacks
+
+# Adaptive DPI: mean tesseract word confidence below which a low-DPI page is re-rendered
+MIN_OCR_CONFIDENCE = 70
+
+# Regions mode: an image region already covered by this many native characters is not OCRed
+# (e.g. scans with an invisible text layer)
+REGION_NATIVE_MIN_CHARS = 30
+
+# Page ranges handed to each worker when one document is split across processes
+PAGE_RANGES_PER_WORKER = 2
+
+CID_RE = re.compile(r'\(cid:\d+\)')
+
+
+def score_text_layer(text):
+    """
+    Score the native text layer of a page.
+    Returns (ok, reason): ok is True when the text is good enough to skip OCR.
+    """
+    cid_chars = sum(len(m) for m in CID_RE.findall(text))
+    stripped = "".join(text.split())
+    n_chars = len(stripped)
+    if n_chars == 0:
+        return False, "empty text layer"
+
+    cid_ratio = cid_chars / n_chars
+    if cid_ratio > GATE_MAX_CID_RATIO:
+        return False, f"cid garbage ({cid_ratio:.2f} > {GATE_MAX_CID_RATIO})"
+
+    if n_chars - cid_chars < GATE_MIN_CHARS:
+        return False, f"too few chars ({n_chars - cid_chars} < {GATE_MIN_CHARS})"
+
+    letter_ratio = sum(c.isalpha() for c in stripped) / n_chars
+    if letter_ratio < GATE_MIN_LETTER_RATIO:
+        return False, f"low letter ratio ({letter_ratio:.2f} < {GATE_MIN_LETTER_RATIO})"
+
+    return True, f"{n_chars} chars, letters {letter_ratio:.2f}"
+
+
+def iter_page_images(pdf_path, page_numbers, dpi=300, page_window=PAGE_WINDOW):
+    """
+    Yield (page_number, PIL image) for the requested 1-based page numbers.
+    Consecutive pages are rendered together, at most `page_window` at a time.
+    """
+    page_numbers = sorted(page_numbers)
+    if not page_numbers:
+        return
+
+    if page_window is None:
+        wanted = set(page_numbers)
+        for i, image in enumerate(convert_from_path(pdf_path, dpi=dpi), 1):
+            if i in wanted:
+                yield i, image
+        return
+
+    # Group pages into runs of consecutive numbers capped at page_window
+    runs = []
+    for n in page_numbers:
+        if runs and n == runs[-1][1] + 1 and n - runs[-1][0] < page_window:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
+
+    for first, last in runs:
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last)
+        for offset, image in enumerate(images):
+            yield first + offset, image
+            image.close()
+        # Release the window before rendering the next one
+        del images
+
+
+def init_ocr_worker(omp_thread_limit=1):
+    """Process pool initializer: cap tesseract threads so N workers do not oversubscribe the cores."""
+    # Inherited by every tesseract subprocess started from this worker
+    os.environ["OMP_THREAD_LIMIT"] = str(omp_thread_limit)
+
+
+def count_pages(pdf_path, text_backend="pdfplumber"):
+    with open_text_backend(pdf_path, text_backend) as doc:
+        return len(doc)
+
+
+def split_page_range(n_pages, n_parts):
+    """Split pages 1..n_pages into at most n_parts contiguous (first, last) ranges."""
+    n_parts = max(1, min(n_parts, n_pages))
+    size, extra = divmod(n_pages, n_parts)
+    ranges = []
+    first = 1
+    for k in range(n_parts):
+        last = first + size - 1 + (1 if k < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+def _ocr_pages(pdf_path, pages, dpi, engine, page_window=PAGE_WINDOW, cache_conn=None,
+               pdf_hash=None, with_conf=False, preprocess=False, cutoff_ratio=0.85, prep_seconds=None):
+    """
+    OCR the given pages at `dpi`, reading/writing the page cache when given.
+    With `preprocess`, images go through processing/preprocess.py first and the time spent
+    is stored in `prep_seconds` (dict page -> seconds) when given.
+    Returns {page: OcrResult}; cached pages have seconds=None.
+    """
+    results = {}
+    # Engines and text sources (image_to_data with confidence / image_to_string) give different
+    # texts: each gets its own cache entries
+    variant = f"{engine.name}:{'conf' if with_conf else 'text'}" + (f"+prep:{cutoff_ratio}" if preprocess else "")
+    if cache_conn is not None:
+        cache_key = (dpi, engine.lang, engine.version)
+        for n in pages:
+            cached = page_cache.get_ocr(cache_conn, pdf_hash, n, *cache_key, variant=variant)
+            # Entries written without confidence cannot drive the adaptive decision
+            if cached is not None and (cached[1] is not None or not with_conf):
+                results[n] = OcrResult(cached[0], cached[1], None)
+        pages = [n for n in pages if n not in results]
+
+    for n, image in iter_page_images(pdf_path, pages, dpi=dpi, page_window=page_window):
+        if preprocess:
+            image, info = preprocess_page(image, cutoff_ratio)
+            if prep_seconds is not None:
+                prep_seconds[n] = prep_seconds.get(n, 0.0) + info["seconds"]
+        results[n] = engine.ocr(image, with_conf=with_conf)
+        if cache_conn is not None:
+            page_cache.put_ocr(
+                cache_conn, pdf_hash, n, *cache_key, results[n].text, results[n].conf, variant=variant
+            )
+
+    return results
+
+
+def extract_page_range(pdf_path, first_page=1, last_page=None, cutoff_ratio=0.85, dpi=300,
+                       page_window=PAGE_WINDOW, ocr_mode="always", lang="fra",
+                       ocr_cache=None, pdf_hash=None, adaptive_dpi=None, min_confidence=MIN_OCR_CONFIDENCE,
+                       ocr_engine="subprocess", log_timings=False, text_backend="pdfplumber",
+                       preprocess=False):
+    """
+    Extract pages first_page..last_page (1-based, inclusive; last_page=None means the last page).
+    `ocr_cache` is the path of a page-level OCR cache (see utils/ocr_cache.py); cached pages
+    are neither rendered nor OCRed again.
+    With `adaptive_dpi` (e.g. 150), pages are OCRed at that DPI first and re-rendered at `dpi`
+    only when the mean word confidence is below `min_confidence`.
+    `ocr_engine` selects the OCR backend (see processing/ocr_engine.py); with `log_timings`
+    the per-page OCR latency is added to the log. `text_backend` selects how the native
+    text layer is read (see processing/text_backends.py). With `preprocess`, page images are
+    binarized, deskewed and cropped to the same band before OCR (see processing/preprocess.py).
+    ocr_mode="regions" OCRs only the embedded images of each page (pdfplumber backend only;
+    adaptive_dpi does not apply).
+    Returns (output, log): one text block and one log line per page, in page order.
+    """
     output = []
     log = []
 
-    with pdfplumber.open(pdf_path) as pdf:
-        images = convert_from_path(pdf_path, dpi=300)
+    # Pass 1: native text layer (cheap) and OCR decision per page
+    pdf_texts = {}
+    gate = {}
+    with open_text_backend(pdf_path, text_backend) as doc:
+        if last_page is None:
+            last_page = len(doc)
+        if ocr_mode == "regions":
+            return _extract_regions_range(
+                doc, first_page, last_page, cutoff_ratio, dpi, pdf_path, page_window,
+                ocr_cache, pdf_hash, ocr_engine, lang, log_timings, preprocess,
+            )
+        for n in range(first_page, last_page + 1):
+            pdf_text = doc.page_text(n, cutoff_ratio)
+            pdf_texts[n] = pdf_text
 
-        for i, page in enumerate(pdf.pages):
-            label = f"--- Page {i+1} ---"
-            height = page.height
+            if ocr_mode == "gate":
+                gate[n] = score_text_layer(pdf_text)
 
-            # Top of page area (cutoff 85%)
-            top = page.within_bbox((0, 0, page.width, height * cutoff_ratio))
-            pdf_text = top.extract_text() or ""
+    to_ocr = [n for n in pdf_texts if n not in gate or not gate[n][0]]
 
-            # OCR from image
-            ocr_text = pytesseract.image_to_string(images[i], lang='fra')
+    # Pass 2: rasterize and OCR only the pages that need it
+    cache_conn = None
+    if ocr_cache and to_ocr:
+        cache_conn = page_cache.open_ocr_cache(ocr_cache)
+        pdf_hash = pdf_hash or compute_file_hash(pdf_path)
+    engine = get_engine(ocr_engine, lang) if to_ocr else None
+    prep_seconds = {}
+    ocr_args = {
+        "engine": engine,
+        "page_window": page_window,
+        "cache_conn": cache_conn,
+        "pdf_hash": pdf_hash,
+        "preprocess": preprocess,
+        "cutoff_ratio": cutoff_ratio,
+        "prep_seconds": prep_seconds,
+    }
 
-            # Compare length to select result
-            if len(ocr_text.strip()) > len(pdf_text.strip()):
-                final_text = ocr_text
-                log.append(f"Page {i+1}: OCR (longer)")
-                output.append(f"{label} (OCR)\n {final_text}")
+    dpi_used = {}
+    if adaptive_dpi:
+        # Cheap low-DPI pass first, re-render at full DPI only where tesseract is unsure
+        ocr_results = _ocr_pages(pdf_path, to_ocr, adaptive_dpi, with_conf=True, **ocr_args)
+        dpi_used = {n: adaptive_dpi for n in ocr_results}
+        retry = [n for n, result in ocr_results.items() if result.conf < min_confidence]
+        retried = _ocr_pages(pdf_path, retry, dpi, with_conf=True, **ocr_args)
+        for n, result in retried.items():
+            # Latency of a retried page includes its low-DPI attempt
+            if result.seconds is not None and ocr_results[n].seconds is not None:
+                result = result._replace(seconds=result.seconds + ocr_results[n].seconds)
+            ocr_results[n] = result
+        dpi_used.update({n: dpi for n in retry})
+    else:
+        ocr_results = _ocr_pages(pdf_path, to_ocr, dpi, **ocr_args)
+
+    if cache_conn is not None:
+        cache_conn.close()
+
+    for n, pdf_text in pdf_texts.items():
+        label = f"--- Page {n} ---"
+        ocr_text, conf, seconds = ocr_results.get(n, (None, None, None))
+        reason = f" [gate: {gate[n][1]}]" if n in gate else ""
+        if n in dpi_used:
+            reason += f" [dpi={dpi_used[n]} conf={conf:.1f}]"
+        if log_timings and n in ocr_results:
+            reason += f" [{engine.name} {seconds:.2f}s]" if seconds is not None else " [cache]"
+            if n in prep_seconds:
+                reason += f" [prep {prep_seconds[n]:.2f}s]"
+
+        # Compare length to select result
+        if ocr_text is not None and len(ocr_text.strip()) > len(pdf_text.strip()):
+            final_text = ocr_text
+            log.append(f"Page {n}: OCR (longer){reason}")
+            output.append(f"{label} (OCR)\n {final_text}")
+        else:
+            final_text = pdf_text
+            if ocr_text is None:
+                log.append(f"Page {n}: Text OK (OCR skipped){reason}")
             else:
-                final_text = pdf_text
-                log.append(f"Page {i+1}: Text OK")
-                output.append(f"{label}\n {final_text}")
-    
-    return "\n\n".join(output), log
\ No newline at end of file
+                log.append(f"Page {n}: Text OK{reason}")
+            output.append(f"{label}\n {final_text}")
+
+    return output, log
+
+
+def _line_in_box(line, box):
+    top, x0, bottom, _ = line
+    center = (top + bottom) / 2
+    return box[0] <= x0 <= box[2] and box[1] <= center <= box[3]
+
+
+def _ocr_regions(pdf_path, layouts, dpi, engine, page_window=PAGE_WINDOW, cache_conn=None,
+                 pdf_hash=None, preprocess=False):
+    """
+    OCR the image regions listed in `layouts` ({page: page_layout}).
+    Returns {page: [(region, OcrResult)]}.
+    """
+    results = {}
+    pending = {}
+    for n, layout in layouts.items():
+        for region in layout["regions"]:
+            variant = "{}:region:{:.0f},{:.0f},{:.0f},{:.0f}".format(engine.name, *region) + ("+prep" if preprocess else "")
+            cached = None
+            if cache_conn is not None:
+                cached = page_cache.get_ocr(cache_conn, pdf_hash, n, dpi, engine.lang, engine.version,
+                                            variant=variant)
+            if cached is not None:
+                results.setdefault(n, []).append((region, OcrResult(cached[0], cached[1], None)))
+            else:
+                pending.setdefault(n, []).append((region, variant))
+
+    scale = dpi / 72
+    for n, image in iter_page_images(pdf_path, list(pending), dpi=dpi, page_window=page_window):
+        x_origin, y_origin = layouts[n]["origin"]
+        for region, variant in pending[n]:
+            x0, top, x1, bottom = region
+            crop = image.crop((
+                int((x0 - x_origin) * scale), int((top - y_origin) * scale),
+                int((x1 - x_origin) * scale), int((bottom - y_origin) * scale),
+            ))
+            if preprocess:
+                crop, _ = preprocess_page(crop, cutoff_ratio=1.0)
+            result = engine.ocr(crop)
+            results.setdefault(n, []).append((region, result))
+            if cache_conn is not None:
+                page_cache.put_ocr(cache_conn, pdf_hash, n, dpi, engine.lang, engine.version,
+                                   result.text, result.conf, variant=variant)
+
+    return results
+
+
+def _extract_regions_range(doc, first_page, last_page, cutoff_ratio, dpi, pdf_path, page_window,
+                           ocr_cache, pdf_hash, engine_name, lang, log_timings, preprocess):
+    """"regions" mode of extract_page_range: native text + OCR of embedded images, in reading order."""
+    layouts = {}
+    for n in range(first_page, last_page + 1):
+        layout = doc.page_layout(n, cutoff_ratio)
+        # Skip images whose area already carries a native text layer
+        layout["regions"] = [
+            box for box in layout["regions"]
+            if sum(len(l[3]) for l in layout["lines"] if _line_in_box(l, box)) < REGION_NATIVE_MIN_CHARS
+        ]
+        layouts[n] = layout
+
+    cache_conn = None
+    region_results = {}
+    if any(layout["regions"] for layout in layouts.values()):
+        if ocr_cache:
+            cache_conn = page_cache.open_ocr_cache(ocr_cache)
+            pdf_hash = pdf_hash or compute_file_hash(pdf_path)
+        engine = get_engine(engine_name, lang)
+        region_results = _ocr_regions(
+            pdf_path, {n: l for n, l in layouts.items() if l["regions"]}, dpi, engine,
+            page_window=page_window, cache_conn=cache_conn, pdf_hash=pdf_hash, preprocess=preprocess,
+        )
+        if cache_conn is not None:
+            cache_conn.close()
+
+    output = []
+    log = []
+    for n, layout in layouts.items():
+        label = f"--- Page {n} ---"
+        regions = region_results.get(n, [])
+        if not regions:
+            output.append(f"{label}\n " + "\n".join(l[3] for l in layout["lines"]))
+            log.append(f"Page {n}: Text OK (no image region)")
+            continue
+
+        # Reading order: native lines and OCRed crops sorted by their top, then left edge.
+        # Stray native characters inside an OCRed image (labels over a map) are dropped.
+        items = [
+            (l[0], l[1], l[3]) for l in layout["lines"]
+            if not any(_line_in_box(l, region) for region, _ in regions)
+        ]
+        items += [(region[1], region[0], result.text.strip()) for region, result in regions]
+        items.sort(key=lambda item: (item[0], item[1]))
+        output.append(f"{label} (OCR)\n " + "\n".join(text for _, _, text in items if text))
+
+        timings = ""
+        if log_timings:
+            timings = " [" + ", ".join(
+                f"{result.seconds:.2f}s" if result.seconds is not None else "cache" for _, result in regions
+            ) + "]"
+        log.append(f"Page {n}: Text + OCR ({len(regions)} image regions){timings}")
+
+    return output, log
+
+
+def _extract_page_range_job(args):
+    pdf_path, first_page, last_page, options = args
+    return extract_page_range(pdf_path, first_page, last_page, **options)
+
+
+def extract_text_with_hybrid_mode(pdf_path, cutoff_ratio=0.85, dpi=300, page_window=PAGE_WINDOW,
+                                  ocr_mode="always", lang="fra", workers=1, ocr_cache=None,
+                                  pdf_hash=None, adaptive_dpi=None, min_confidence=MIN_OCR_CONFIDENCE,
+                                  ocr_engine="subprocess", log_timings=False, text_backend="pdfplumber",
+                                  preprocess=False):
+    """
+    Hybrid extraction (pdfplumber text layer + Tesseract OCR) of one PDF.
+    With workers > 1 the page range is split across a process pool (useful for very
+    large documents) and the results are reassembled in page order.
+    With `ocr_cache` (path of the page-level cache), pages already OCRed with the same
+    engine/dpi/lang/tesseract version are read from the cache instead of calling tesseract
+    (`pdf_hash` avoids re-hashing when the caller already knows it).
+    With `adaptive_dpi`, pages are first OCRed at that lower DPI and re-rendered at `dpi`
+    only when tesseract's mean word confidence is below `min_confidence`.
+    `ocr_engine` is "subprocess" (pytesseract) or "tesserocr" (model kept loaded per process);
+    `log_timings` adds the OCR latency of each page to its log line.
+    `text_backend` is "pdfplumber" or "pdfium" (faster, same crop region) for the native text layer.
+    `preprocess` cleans page images (grayscale, Otsu, deskew, crop to the cutoff band) before OCR.
+    Returns (text, log_lines).
+    """
+    if ocr_mode not in OCR_MODES:
+        raise ValueError(f"Unsupported OCR mode: {ocr_mode}")
+    if ocr_engine not in OCR_ENGINES:
+        raise ValueError(f"Unsupported OCR engine: {ocr_engine}")
+    if text_backend not in TEXT_BACKENDS:
+        raise ValueError(f"Unsupported text backend: {text_backend}")
+    if ocr_mode == "regions" and text_backend != "pdfplumber":
+        raise ValueError("ocr_mode='regions' needs the pdfplumber text backend (image positions)")
+
+    options = {
+        "cutoff_ratio": cutoff_ratio,
+        "dpi": dpi,
+        "page_window": page_window,
+        "ocr_mode": ocr_mode,
+        "lang": lang,
+        "ocr_cache": ocr_cache,
+        "pdf_hash": pdf_hash,
+        "adaptive_dpi": adaptive_dpi,
+        "min_confidence": min_confidence,
+        "ocr_engine": ocr_engine,
+        "log_timings": log_timings,
+        "text_backend": text_backend,
+        "preprocess": preprocess,
+    }
+    if workers <= 1:
+        output, log = extract_page_range(pdf_path, **options)
+        return "\n\n".join(output), log
+
+    n_pages = count_pages(pdf_path, text_backend)
+    if n_pages == 0:
+        return "", []
+    if ocr_cache and not pdf_hash:
+        # Hash once here rather than in every worker
+        options["pdf_hash"] = compute_file_hash(pdf_path)
+
+    # Several ranges per worker so one slow (scanned) range does not leave the other cores idle
+    ranges = split_page_range(n_pages, workers * PAGE_RANGES_PER_WORKER)
+    jobs = [(pdf_path, first, last, options) for first, last in ranges]
+
+    output, log = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_ocr_worker) as pool:
+        # map() yields results in submission order, i.e. page order
+        for range_output, range_log in pool.map(_extract_page_range_job, jobs):
+            output.extend(range_output)
+            log.extend(range_log)
+
+    return "\n\n".join(output), log
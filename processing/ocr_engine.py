@@ -0,0 +1,111 @@
+import time
+from typing import NamedTuple, Optional
+import pytesseract
+
+# OCR engines used by processing/extract_text.py
+# - "subprocess": pytesseract, one tesseract process per page (reloads the traineddata every time)
+# - "tesserocr":  libtesseract API binding, the language model stays loaded in the worker process
+OCR_ENGINES = ("subprocess", "tesserocr")
+
+
+class OcrResult(NamedTuple):
+    text: str
+    conf: Optional[float]     # mean word confidence (0-100), when requested
+    seconds: float            # OCR latency for this page
+
+
+def mean_confidence(data):
+    """Mean tesseract confidence (0-100) of the recognized words of an image_to_data dict."""
+    confs = [float(c) for c, w in zip(data["conf"], data["text"]) if float(c) >= 0 and w.strip()]
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+def text_from_data(data):
+    """Rebuild page text from an image_to_data dict (lines joined by newlines, blank line between paragraphs)."""
+    paragraphs = []
+    lines = []
+    words = []
+    current_line = current_par = None
+    for word, block, par, line in zip(data["text"], data["block_num"], data["par_num"], data["line_num"]):
+        if not word.strip():
+            continue
+        if (block, par, line) != current_line:
+            if words:
+                lines.append(" ".join(words))
+                words = []
+            if (block, par) != current_par and lines:
+                paragraphs.append("\n".join(lines))
+                lines = []
+            current_line, current_par = (block, par, line), (block, par)
+        words.append(word)
+    if words:
+        lines.append(" ".join(words))
+    if lines:
+        paragraphs.append("\n".join(lines))
+    return "\n\n".join(paragraphs)
+
+
+class SubprocessEngine:
+    """pytesseract: spawns tesseract for every page."""
+
+    name = "subprocess"
+
+    def __init__(self, lang="fra"):
+        self.lang = lang
+        self.version = str(pytesseract.get_tesseract_version())
+
+    def ocr(self, image, with_conf=False):
+        start = time.perf_counter()
+        if with_conf:
+            data = pytesseract.image_to_data(image, lang=self.lang, output_type=pytesseract.Output.DICT)
+            text, conf = text_from_data(data), mean_confidence(data)
+        else:
+            text, conf = pytesseract.image_to_string(image, lang=self.lang), None
+        return OcrResult(text, conf, time.perf_counter() - start)
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """libtesseract through tesserocr: the model is loaded once and reused for every page."""
+
+    name = "tesserocr"
+
+    def __init__(self, lang="fra"):
+        try:
+            import tesserocr
+        except ImportError as e:
+            raise ImportError("The 'tesserocr' OCR engine requires `pip install tesserocr`") from e
+        self.lang = lang
+        # "tesseract 5.3.0\n leptonica-..." -> "5.3.0", same as pytesseract.get_tesseract_version()
+        self.version = tesserocr.tesseract_version().split()[1]
+        self._api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def ocr(self, image, with_conf=False):
+        start = time.perf_counter()
+        self._api.SetImage(image)
+        text = self._api.GetUTF8Text()
+        conf = float(self._api.MeanTextConf()) if with_conf else None
+        self._api.Clear()
+        return OcrResult(text, conf, time.perf_counter() - start)
+
+    def close(self):
+        self._api.End()
+
+
+_ENGINE_CLASSES = {"subprocess": SubprocessEngine, "tesserocr": TesserocrEngine}
+_engines = {}
+
+
+def get_engine(name="subprocess", lang="fra"):
+    """
+    Return the OCR engine of this process for (name, lang), creating it on first use.
+    Engines are per process: pool workers each keep their own loaded model.
+    """
+    if name not in _ENGINE_CLASSES:
+        raise ValueError(f"Unsupported OCR engine: {name}")
+    key = (name, lang)
+    if key not in _engines:
+        _engines[key] = _ENGINE_CLASSES[name](lang=lang)
+    return _engines[key]
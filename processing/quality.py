@@ -0,0 +1,110 @@
+import re
+import time
+import argparse
+from collections import Counter
+import numpy as np
+
+from database import database_manager
+
+# Garbage filter run over text_chunks before scripts/index_chroma_from_db.py:
+# OCR of maps, plans and tables yields chunks of stray letters and digits ("l 1 | ; Il . 4 ,a")
+# that cost embedding time and come back as noise in retrieval.
+# Three features per chunk, the character ones computed with numpy over a whole batch at once:
+# - alphabetic ratio: letters / non-space characters
+# - dictionary hit rate: share of words found in the corpus vocabulary (words used in several
+#   files, so one-off OCR fragments are not in it) or in a list of French function words
+# - character entropy (bits): very low for runs of dots, dashes, repeated letters
+# quality_score = alpha * hits * entropy factor; chunks below QUALITY_THRESHOLD get low_quality = 1.
+QUALITY_THRESHOLD = 0.35
+MIN_ENTROPY = 2.5            # below: repeated characters (leaders, rules)
+FULL_ENTROPY = 3.5           # above: no penalty (French prose is around 4.2 bits)
+DICT_MIN_FILES = 3           # a word is in the vocabulary when used in at least that many files
+SCORE_BATCH = 5000           # chunks per vectorized batch (one uint32 per character)
+
+FUNCTION_WORDS = set("""
+le la les un une des de du d l au aux et ou en dans sur sous par pour avec sans ce cet cette ces
+son sa ses leur leurs qui que qu quoi dont où ne pas plus est sont été être a ont avoir il elle
+ils elles on se s nous vous y à ainsi aussi comme mais donc car si lors entre vers chez afin
+""".split())
+
+_WORDS = re.compile(r"[^\W\d_]{2,}")
+_TABLE_SIZE = 0x250          # Basic Latin to Latin Extended-B; anything beyond shares the last slot
+_IS_LETTER = np.array([chr(c).isalpha() for c in range(_TABLE_SIZE - 1)] + [False])
+_IS_SPACE = np.array([chr(c).isspace() for c in range(_TABLE_SIZE - 1)] + [False])
+
+
+def char_features(texts):
+    """(alphabetic ratio, entropy in bits) of every text, as two arrays."""
+    n = len(texts)
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=n)
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    codes = np.minimum(codes, _TABLE_SIZE - 1)
+    owner = np.repeat(np.arange(n), lengths)
+
+    visible = ~_IS_SPACE[codes]
+    owner, codes = owner[visible], codes[visible]
+    nb_visible = np.bincount(owner, minlength=n)
+    nb_letters = np.bincount(owner, weights=_IS_LETTER[codes], minlength=n)
+    alpha = nb_letters / np.maximum(nb_visible, 1)
+
+    # Character histogram of every text in one np.unique over (text, character) keys
+    keys, counts = np.unique(owner * _TABLE_SIZE + codes, return_counts=True)
+    key_owner = keys // _TABLE_SIZE
+    p = counts / nb_visible[key_owner]
+    entropy = -np.bincount(key_owner, weights=p * np.log2(p), minlength=n)
+    return alpha, entropy
+
+
+def build_vocabulary(rows, min_files=DICT_MIN_FILES):
+    """Words (lower-cased) used in at least `min_files` files of `rows` [(chunk_id, file_id, text)]."""
+    words_by_file = {}
+    for _, file_id, text in rows:
+        words_by_file.setdefault(file_id, set()).update(_WORDS.findall(text.lower()))
+    # Tiny corpora: a word used in every file is enough
+    min_files = min(min_files, len(words_by_file)) or 1
+    files_per_word = Counter(word for words in words_by_file.values() for word in words)
+    return {word for word, count in files_per_word.items() if count >= min_files} | FUNCTION_WORDS
+
+
+def dictionary_hits(texts, vocabulary):
+    hits = np.zeros(len(texts))
+    for i, text in enumerate(texts):
+        words = _WORDS.findall(text.lower())
+        if words:
+            hits[i] = sum(word in vocabulary for word in words) / len(words)
+    return hits
+
+
+def quality_scores(texts, vocabulary):
+    alpha, entropy = char_features(texts)
+    hits = dictionary_hits(texts, vocabulary)
+    entropy_factor = np.clip((entropy - MIN_ENTROPY) / (FULL_ENTROPY - MIN_ENTROPY), 0, 1)
+    return alpha * hits * entropy_factor
+
+
+def main(threshold=QUALITY_THRESHOLD):
+    start_time = time.perf_counter()
+    with database_manager.get_connection() as conn:
+        rows = conn.execute("SELECT id, file_id, text FROM text_chunks ORDER BY id").fetchall()
+    vocabulary = build_vocabulary(rows)
+
+    results = []
+    for s in range(0, len(rows), SCORE_BATCH):
+        batch = rows[s:s + SCORE_BATCH]
+        scores = quality_scores([text for _, _, text in batch], vocabulary)
+        results += [(round(float(score), 3), int(score < threshold), chunk_id)
+                    for (chunk_id, _, _), score in zip(batch, scores)]
+    elapsed = time.perf_counter() - start_time
+
+    nb_updated = database_manager.update_chunk_quality(results)
+    nb_low = sum(low for _, low, _ in results)
+    print(f"Chunks évalués : {len(results)} en {elapsed:.2f}s | vocabulaire : {len(vocabulary)} mots")
+    print(f"Chunks de mauvaise qualité (score < {threshold}) : {nb_low} ({nb_low / max(len(results), 1):.1%})"
+          f" — ignorés par l'indexation | lignes mises à jour : {nb_updated}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score de qualité des chunks (bruit OCR) avant l'indexation")
+    parser.add_argument("--threshold", type=float, default=QUALITY_THRESHOLD)
+    args = parser.parse_args()
+    main(threshold=args.threshold)
@@ -0,0 +1,143 @@
+import pdfplumber
+
+# Native text-layer backends used by processing/extract_text.py
+# - "pdfplumber": historical backend (within_bbox(...).extract_text())
+# - "pdfium":     pypdfium2, much faster on dense pages, same crop region
+TEXT_BACKENDS = ("pdfplumber", "pdfium")
+
+# Embedded images smaller than this (points, both sides) are ignored as OCR regions (logos, icons)
+MIN_REGION_PT = 72
+
+
+class PdfplumberBackend:
+    name = "pdfplumber"
+
+    def __init__(self, pdf_path):
+        self._pdf = pdfplumber.open(pdf_path)
+
+    def __len__(self):
+        return len(self._pdf.pages)
+
+    def page_text(self, page_number, cutoff_ratio=0.85):
+        """Text of the top `cutoff_ratio` of the page (1-based page number)."""
+        page = self._pdf.pages[page_number - 1]
+        height = page.height
+
+        # Top of page area (cutoff 85%)
+        top = page.within_bbox((0, 0, page.width, height * cutoff_ratio))
+        text = top.extract_text() or ""
+
+        # pdfplumber caches parsed objects per page; drop them once the page is done
+        page.close()
+        return text
+
+    def page_layout(self, page_number, cutoff_ratio=0.85, min_region=MIN_REGION_PT):
+        """
+        Positioned content of the top `cutoff_ratio` of the page (1-based page number):
+        - lines:   [(top, x0, bottom, text)] of the native text layer
+        - regions: [(x0, top, x1, bottom)] of embedded images, clipped to the band, overlaps merged
+        - origin:  (x, y) of the page box, to convert coordinates to rendered pixels
+        Coordinates are PDF points from the top-left of the page.
+        """
+        page = self._pdf.pages[page_number - 1]
+        x_origin, y_origin = page.bbox[0], page.bbox[1]
+        band_bottom = y_origin + page.height * cutoff_ratio
+
+        top = page.within_bbox((x_origin, y_origin, x_origin + page.width, band_bottom))
+        lines = [(l["top"], l["x0"], l["bottom"], l["text"]) for l in top.extract_text_lines()]
+
+        boxes = []
+        for im in page.images:
+            x0, t = max(im["x0"], x_origin), max(im["top"], y_origin)
+            x1, b = min(im["x1"], x_origin + page.width), min(im["bottom"], band_bottom)
+            if x1 - x0 >= min_region and b - t >= min_region:
+                boxes.append((x0, t, x1, b))
+
+        page.close()
+        return {"lines": lines, "regions": merge_boxes(boxes), "origin": (x_origin, y_origin)}
+
+    def close(self):
+        self._pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PdfiumBackend:
+    name = "pdfium"
+
+    def __init__(self, pdf_path):
+        try:
+            import pypdfium2
+        except ImportError as e:
+            raise ImportError("The 'pdfium' text backend requires `pip install pypdfium2`") from e
+        self._pdf = pypdfium2.PdfDocument(pdf_path)
+
+    def __len__(self):
+        return len(self._pdf)
+
+    def page_text(self, page_number, cutoff_ratio=0.85):
+        """Text of the top `cutoff_ratio` of the page (1-based page number)."""
+        page = self._pdf[page_number - 1]
+        textpage = page.get_textpage()
+        try:
+            # PDF user space: origin at the bottom-left, so "top 85%" keeps y >= top - 85% of the height
+            left, bottom, right, top = page.get_bbox()
+            cut = top - (top - bottom) * cutoff_ratio
+            # Same crop as pdfplumber's within_bbox: characters whose box lies fully inside the band
+            # (get_text_bounded would also keep those merely crossing its edge). The loose box spans
+            # the font's ascent/descent, like pdfminer's character boxes.
+            nb_chars = textpage.count_chars()
+            runs, run_start = [], None
+            for i in range(nb_chars + 1):
+                inside = False
+                if i < nb_chars:
+                    x0, y0, x1, y1 = textpage.get_charbox(i, loose=True)
+                    inside = y0 >= cut and y1 <= top and x0 >= left and x1 <= right
+                if inside and run_start is None:
+                    run_start = i
+                elif not inside and run_start is not None:
+                    runs.append(textpage.get_text_range(run_start, i - run_start))
+                    run_start = None
+            text = "".join(runs)
+        finally:
+            textpage.close()
+            page.close()
+        # pdfium separates lines with CRLF, pdfplumber with LF, and marks line-end hyphens as U+FFFE
+        return text.replace("\r\n", "\n").replace("\r", "\n").replace("\ufffe", "-")
+
+    def close(self):
+        self._pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def merge_boxes(boxes):
+    """Merge overlapping (x0, top, x1, bottom) boxes, e.g. scans split into image tiles."""
+    merged = []
+    for box in sorted(boxes, key=lambda b: (b[1], b[0])):
+        for i, other in enumerate(merged):
+            if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+                merged[i] = (min(box[0], other[0]), min(box[1], other[1]),
+                             max(box[2], other[2]), max(box[3], other[3]))
+                break
+        else:
+            merged.append(box)
+    return merged
+
+
+_BACKEND_CLASSES = {"pdfplumber": PdfplumberBackend, "pdfium": PdfiumBackend}
+
+
+def open_text_backend(pdf_path, name="pdfplumber"):
+    """Open `pdf_path` with the given native-text backend (usable as a context manager)."""
+    if name not in _BACKEND_CLASSES:
+        raise ValueError(f"Unsupported text backend: {name}")
+    return _BACKEND_CLASSES[name](pdf_path)
@@ -0,0 +1,96 @@
+import os
+import re
+import sys
+import time
+import argparse
+from processing import clean_text as engine
+
+# Equivalence check + benchmark of the cleaning engine (processing/clean_text.py)
+# against the historical one-re.sub-per-rule functions, kept verbatim below.
+# Every text is run through normalize + clean (both variants); outputs must be byte-identical.
+REPEAT = 5
+
+
+def legacy_normalize_text(text):
+    text = text.replace('\x0c', '')
+    text = re.sub(r'(cid:\d+)', '', text)
+    text = re.sub(r'[ﬁﬂ]', '', text)
+    text = re.sub(r"[’`‘]", "'", text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    return text.strip()
+
+
+def legacy_clean_text(text, avis=False):
+    text = re.sub(r'--- Page \d+ --- \(OCR\)', '', text)
+    if avis:
+        text = re.sub(r'AVIS D[ÉE]LIB[ÉE]R[ÉE] N[°ºo]\s?\d{4}-\d+.*?région.*?\n?', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^[=|_\-\[\]<>\\/#*]{3,}.*$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\bla \d+/\d+\b', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^\s*.*\(source\s*:\s*dossier\)\s*$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'(?<=[a-z,;])\n(?=[a-zéèàù])', ' ', text)
+    text = re.sub(r'\n?\d{1,2}/\d{1,2}\n?', '', text)
+    text = re.sub(r'\.([^\s])', r'. \1', text)
+    text = re.sub(r':([^\s])', r': \1', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\n{2,}', '\n\n', text)
+    return text.strip()
+
+
+def legacy_pipeline(text):
+    normalized = legacy_normalize_text(text)
+    return legacy_clean_text(normalized), legacy_clean_text(normalized, avis=True)
+
+
+def engine_pipeline(text):
+    normalized = engine.normalize_text(text)
+    return (engine.clean_text(normalized),
+            engine.apply_rules(normalized, engine.CLEAN_RULES_AVIS).strip())
+
+
+def load_texts(input_dirs):
+    texts = {}
+    for input_dir in input_dirs:
+        for file in sorted(os.listdir(input_dir)):
+            if file.lower().endswith(".txt"):
+                path = os.path.join(input_dir, file)
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    texts[path] = f.read()
+    return texts
+
+
+def throughput(pipeline, texts, repeat=REPEAT):
+    total_bytes = sum(len(t.encode("utf-8")) for t in texts.values()) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts.values():
+            pipeline(text)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    return total_bytes / 1e6 / elapsed
+
+
+def run(input_dirs, repeat=REPEAT):
+    texts = load_texts(input_dirs)
+    print(f"{len(texts)} fichiers texte ({sum(len(t) for t in texts.values()) / 1e6:.2f} M caractères)")
+
+    ok = True
+    for path, text in texts.items():
+        if legacy_pipeline(text) != engine_pipeline(text):
+            print(f"Sortie différente : {path}")
+            ok = False
+    print("Équivalence octet par octet : " + ("OK" if ok else "ÉCHEC"))
+
+    before = throughput(legacy_pipeline, texts, repeat)
+    after = throughput(engine_pipeline, texts, repeat)
+    print(f"Avant : {before:.1f} Mo/s")
+    print(f"Après : {after:.1f} Mo/s (x{after / before:.2f})")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Équivalence et débit du moteur de nettoyage")
+    parser.add_argument("input_dirs", nargs="*", default=["demo_docs"])
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.input_dirs, args.repeat) else 1)
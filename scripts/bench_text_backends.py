@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+from difflib import SequenceMatcher
+from processing.text_backends import open_text_backend, TEXT_BACKENDS
+
+# Parity check + benchmark of the native text backends (pdfplumber vs pdfium)
+# on a folder of PDFs, by default demo_docs/pdf (the demo avis rendered as PDF).
+MIN_SIMILARITY = 0.95
+
+
+def content(text):
+    # Backends break lines and place spaces differently (pdfplumber often drops them):
+    # only the characters count
+    return "".join(text.split())
+
+
+def read_all_pages(pdf_path, backend, cutoff_ratio):
+    with open_text_backend(pdf_path, backend) as doc:
+        return [doc.page_text(n, cutoff_ratio) for n in range(1, len(doc) + 1)]
+
+
+def page_parity(ref, text):
+    """Similarity of the characters of one page."""
+    return SequenceMatcher(None, content(ref), content(text), autojunk=False).ratio()
+
+
+def run(input_dir, backends, cutoff_ratio=0.85, reference="pdfplumber"):
+    files = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(".pdf"))
+    print(f"Dossier : {input_dir} ({len(files)} PDF)")
+
+    texts = {b: {} for b in backends}
+    for backend in backends:
+        nb_pages = 0
+        start = time.perf_counter()
+        for file in files:
+            pages = read_all_pages(os.path.join(input_dir, file), backend, cutoff_ratio)
+            texts[backend][file] = pages
+            nb_pages += len(pages)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"{backend:>10} : {nb_pages} pages en {elapsed:.2f}s ({nb_pages / elapsed:.1f} pages/s)")
+
+    # Parity against the reference backend, page by page
+    ok = True
+    for backend in backends:
+        if backend == reference:
+            continue
+        ratios = []
+        for file in files:
+            ref_pages, pages = texts[reference][file], texts[backend][file]
+            if len(ref_pages) != len(pages):
+                print(f"{file}: nombre de pages différent ({len(ref_pages)} vs {len(pages)})")
+                ok = False
+                continue
+            for n, (a, b) in enumerate(zip(ref_pages, pages), 1):
+                ratio = page_parity(a, b)
+                ratios.append(ratio)
+                if ratio < MIN_SIMILARITY:
+                    print(f"{file} page {n}: similarité {ratio:.3f} < {MIN_SIMILARITY}")
+                    ok = False
+        if ratios:
+            print(f"Parité {backend} vs {reference} : moyenne {sum(ratios) / len(ratios):.4f}, min {min(ratios):.4f}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parité et débit des backends texte natifs")
+    parser.add_argument("input_dir", nargs="?", default=os.path.join("demo_docs", "pdf"))
+    parser.add_argument("--backends", nargs="+", choices=TEXT_BACKENDS, default=list(TEXT_BACKENDS))
+    parser.add_argument("--cutoff-ratio", type=float, default=0.85)
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.input_dir, args.backends, args.cutoff_ratio) else 1)
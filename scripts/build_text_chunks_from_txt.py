@@ -1,77 +1,286 @@
+import time
 import sqlite3
+import argparse
 from pathlib import Path
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from processing.chunking import get_chunker, CHUNKERS
+from processing.extract_sections_avis import find_section_offsets, section_at
+from processing.clean_text import strip_page_furniture
+from database.database_manager import backfill_section_offsets, backfill_content_hashes, content_hash
+from utils.hashing import hash_files
+from utils.manifest import make_params_key
 
 # --- Paths ---
 BASE_DIR = Path(__file__).resolve().parent.parent
 DB_PATH  = BASE_DIR / "database" / "observance.db"
 TXT_DIR  = BASE_DIR / "data" / "avis_couples_txt"   # Folder with TXT avis
+HASH_CACHE_DB = BASE_DIR / "data" / "hash_cache.db"
 
-# --- Chunking config ---
-CHUNK_SIZE = 800
-CHUNK_OVERLAP = 100
+# --- Chunking config (sizes: processing/chunking.py) ---
+# Bump when the chunking itself changes (furniture stripping, sections...)
+CHUNKER_VERSION = "3"
+# Documents tokenized together (one batched call to the fast tokenizer)
+SPLIT_BATCH = 32
+# Chunk rows written per transaction (whole files only, so a file is never half-replaced)
+INSERT_BATCH = 5000
+
+
+def load_file_projects(cur):
+    """file_name -> (file_id, project_id) for every file, in one query (project_id None if unlinked)."""
+    mapping = {}
+    rows = cur.execute("""
+        SELECT f.file_name, f.id, MIN(pf.project_id)
+        FROM files f
+        LEFT JOIN project_files pf ON pf.file_id = f.id
+        GROUP BY f.id
+        ORDER BY f.id DESC
+    """)
+    for file_name, file_id, project_id in rows:
+        # Descending ids: the first file with a given name wins, as with the former LIMIT 1 lookup
+        mapping[file_name] = (file_id, project_id)
+    return mapping
+
+
+def load_stored_sections(cur):
+    """
+    file_id -> (content hash, [(section, start, end, heading)]) for the latest extracted text of
+    every file, in one query. Offsets are shifted to the stripped content, as the TXT texts are.
+    """
+    stored = {}
+    rows = cur.execute("""
+        SELECT et.file_id, et.content_hash, et.content_start,
+               ts.section, ts.start_offset, ts.end_offset, ts.heading
+        FROM extracted_texts et
+        JOIN (SELECT MAX(id) AS id FROM extracted_texts GROUP BY file_id) latest ON latest.id = et.id
+        LEFT JOIN text_sections ts ON ts.extracted_text_id = et.id
+        WHERE et.content_hash IS NOT NULL AND et.content_start IS NOT NULL
+        ORDER BY et.file_id, ts.start_offset
+    """)
+    for file_id, stored_hash, lead, section, start, end, heading in rows:
+        _, sections = stored.setdefault(file_id, (stored_hash, []))
+        if section is not None:
+            sections.append((section, start - lead, end - lead, heading))
+    return stored
+
+
+def section_offsets(stored, file_id, text):
+    """
+    Section boundaries of `text`: the offsets stored in text_sections when `text` is the
+    latest extracted content of the file (same hash), else computed once from `text`.
+    """
+    stored_hash, sections = stored.get(file_id, (None, None))
+    if sections and stored_hash == content_hash(text):
+        return sections
+    return find_section_offsets(text)
+
+
+def chunk_rows(stored, doc, spans):
+    """text_chunks rows of one document, each tagged with the section it starts in."""
+    text = doc["text"]
+    offsets = section_offsets(stored, doc["file_id"], text)
+    rows = []
+    for i, (start, end, n_tokens) in enumerate(spans):
+        chunk = text[start:end]
+        # Without a tokenizer ("chars" chunker), ~4 characters per token
+        tokens_est = n_tokens if n_tokens is not None else len(chunk) // 4
+        rows.append((doc["project_id"], doc["file_id"], i, section_at(offsets, start),
+                     chunk, tokens_est, len(chunk.split())))
+    return rows
+
+def delete_file_chunks(cur, file_ids):
+    """Delete the chunks of some files and their embeddings (FTS rows follow through the triggers)."""
+    params = [(file_id,) for file_id in file_ids]
+    cur.executemany(
+        "DELETE FROM text_chunk_embeddings WHERE chunk_id IN (SELECT id FROM text_chunks WHERE file_id = ?)",
+        params
+    )
+    cur.executemany("DELETE FROM text_chunks WHERE file_id = ?", params)
+    cur.executemany("DELETE FROM chunk_sources WHERE file_id = ?", params)
+
+
+def write_chunk_batch(conn, batch):
+    """Replace the chunks of every file of `batch` [(file_id, source_row, chunk_rows)] in one transaction."""
+    cur = conn.cursor()
+    with conn:
+        delete_file_chunks(cur, [file_id for file_id, _, _ in batch])
+        cur.executemany("""
+            INSERT INTO text_chunks (project_id, file_id, chunk_index, section, text, tokens_est, words)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [row for _, _, rows in batch for row in rows])
+        cur.executemany("""
+            INSERT INTO chunk_sources (file_id, txt_path, content_hash, params_key, nb_chunks, project_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [source for _, source, _ in batch])
+
+
+def main(full=False, chunker_name="tokens", exact_saved=False):
+    # Section offsets of extracted texts imported without them (e.g. from CSV)
+    nb_backfilled = backfill_section_offsets()
+    if nb_backfilled:
+        print(f"Offsets de sections calculés pour {nb_backfilled} textes")
+    nb_hashed = backfill_content_hashes()
+    if nb_hashed:
+        print(f"Empreintes de contenu calculées pour {nb_hashed} textes")
 
-def main():
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
 
-    # Clear old chunks (optional, comment out if you want to append)
-    cur.execute("DELETE FROM text_chunks;")
-    cur.execute("DELETE FROM text_chunk_embeddings;")
-    conn.commit()
+    if full:
+        # Full rebuild: every chunk is recreated (vectors stay in embedding_cache, keyed by text)
+        cur.execute("DELETE FROM text_chunks;")
+        cur.execute("DELETE FROM text_chunk_embeddings;")
+        cur.execute("DELETE FROM chunk_sources;")
+        conn.commit()
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP
-    )
+    chunker = get_chunker(chunker_name)
+    params_key = make_params_key(CHUNKER_VERSION, **chunker.params)
 
-    total_chunks = 0
+    total_chunks, total_tokens = 0, 0
+    total_bytes_saved, total_chunks_saved = 0, 0
+    nb_unchanged = 0
+    split_seconds, db_seconds = 0.0, 0.0
+    start_time = time.perf_counter()
     txt_files = sorted(TXT_DIR.glob("*.txt"))
-    print(f"Dossier TXT: {TXT_DIR} | Fichiers trouvés: {len(txt_files)}")
+    print(f"Dossier TXT: {TXT_DIR} | Fichiers trouvés: {len(txt_files)} | chunker: {chunker.name}")
+
+    # Incremental mode: files whose content and chunking parameters did not change keep
+    # their chunks (and chunk ids, so their embeddings stay valid)
+    hashes = hash_files([str(p) for p in txt_files], cache_path=str(HASH_CACHE_DB))
+    sources = {
+        file_id: (txt_path, content_hash, params_key, project_id)
+        for file_id, txt_path, content_hash, params_key, project_id in cur.execute(
+            "SELECT file_id, txt_path, content_hash, params_key, project_id FROM chunk_sources"
+        )
+    }
+    file_projects = load_file_projects(cur)
+    stored_sections = load_stored_sections(cur)
+
+    pending = []
+    batch, batch_rows = [], 0
+    # Files chunked by a previous run but skipped now (emptied, unlinked from their project)
+    skipped = []
+    # Unchanged files linked to another project since the last run: (project_id, file_id)
+    retagged = []
+
+    def split_pending():
+        nonlocal batch, batch_rows, total_chunks, total_tokens, total_chunks_saved, split_seconds, db_seconds
+        split_start = time.perf_counter()
+        all_spans = chunker.split_texts([doc["text"] for doc in pending])
+        raw_counts = {}
+        if exact_saved:
+            # Chunks the page headers/footers would have produced: second split, on the raw texts
+            stripped = [doc for doc in pending if doc["bytes_saved"]]
+            raw_spans = chunker.split_texts([doc["raw_text"] for doc in stripped])
+            raw_counts = {id(doc): len(spans) for doc, spans in zip(stripped, raw_spans)}
+        split_seconds += time.perf_counter() - split_start
+
+        for doc, spans in zip(pending, all_spans):
+            rows = chunk_rows(stored_sections, doc, spans)
+            if id(doc) in raw_counts:
+                chunks_saved = raw_counts[id(doc)] - len(rows)
+            elif doc["bytes_saved"] and rows:
+                # Estimate: bytes removed over the average chunk size of the document
+                chunk_bytes = len(doc["text"].encode("utf-8")) / len(rows)
+                chunks_saved = round(doc["bytes_saved"] / chunk_bytes)
+            else:
+                chunks_saved = 0
+            total_chunks_saved += chunks_saved
+            batch.append((doc["file_id"], (doc["file_id"], doc["txt_path"], doc["content_hash"], params_key, len(rows), doc["project_id"]), rows))
+            batch_rows += len(rows)
+            total_chunks += len(rows)
+            total_tokens += sum(row[5] for row in rows)
+            print(f"{doc['name']}: {len(rows)} chunks (project_id={doc['project_id']}, file_id={doc['file_id']})"
+                  f" | en-têtes/pieds de page : -{doc['bytes_saved']} octets, {'' if exact_saved else '~'}-{chunks_saved} chunks")
+
+            if batch_rows >= INSERT_BATCH:
+                db_start = time.perf_counter()
+                write_chunk_batch(conn, batch)
+                db_seconds += time.perf_counter() - db_start
+                batch, batch_rows = [], 0
+        pending.clear()
 
     for txt_fp in txt_files:
         stem = txt_fp.stem               
         pdf_name = stem + ".pdf"         
 
-        # Lookup file_id in table files
-        row = cur.execute(
-            "SELECT id FROM files WHERE file_name = ? LIMIT 1", 
-            (pdf_name,)
-        ).fetchone()
-        if not row:
+        # file_id / project_id from the prefetched mapping
+        if pdf_name not in file_projects:
             print(f"Aucun file_id pour '{txt_fp.name}' (attendu '{pdf_name}')")
             continue
-        file_id = row[0]
-
-        # Lookup project_id via project_files
-        prow = cur.execute(
-            "SELECT project_id FROM project_files WHERE file_id = ? LIMIT 1", 
-            (file_id,)
-        ).fetchone()
-        if not prow:
+        file_id, project_id = file_projects[pdf_name]
+
+        source = sources.pop(file_id, None)
+        if project_id is None:
             print(f"Pas de project_id trouvé pour file_id={file_id}")
+            if source:
+                skipped.append(file_id)
+            continue
+
+        content_hash = hashes[str(txt_fp)]
+        if source and source[1:3] == (content_hash, params_key):
+            nb_unchanged += 1
+            if source[3] != project_id:
+                # File linked to another project: same chunks (and embeddings), new project_id
+                retagged.append((project_id, file_id))
             continue
-        project_id = prow[0]
 
         # Load text
-        text = txt_fp.read_text(encoding="utf-8", errors="ignore").strip()
-        if not text:
+        raw_text = txt_fp.read_text(encoding="utf-8", errors="ignore").strip()
+        if not raw_text:
             print(f"Fichier vide: {txt_fp.name} — ignoré")
+            if source:
+                skipped.append(file_id)
             continue
 
-        # Split into chunks
-        chunks = splitter.split_text(text)
-        for i, chunk in enumerate(chunks):
-            cur.execute("""
-                INSERT INTO text_chunks (project_id, file_id, chunk_index, text)
-                VALUES (?, ?, ?, ?)
-            """, (project_id, file_id, i, chunk))
-        total_chunks += len(chunks)
-        print(f"{txt_fp.name}: {len(chunks)} chunks (project_id={project_id}, file_id={file_id})")
-
-    conn.commit()
+        # Recurring page headers/footers would each become chunks to embed
+        text, bytes_saved = strip_page_furniture(raw_text)
+        total_bytes_saved += bytes_saved
+
+        pending.append({
+            "name": txt_fp.name, "txt_path": str(txt_fp), "file_id": file_id, "project_id": project_id,
+            "content_hash": content_hash, "text": text.strip(), "bytes_saved": bytes_saved,
+            "raw_text": raw_text if exact_saved else None,
+        })
+        if len(pending) >= SPLIT_BATCH:
+            split_pending()
+
+    if pending:
+        split_pending()
+
+    db_start = time.perf_counter()
+    if batch:
+        write_chunk_batch(conn, batch)
+
+    # TXT files removed since the last run, or skipped this time: drop their chunks
+    removed = [file_id for file_id, (txt_path, _, _, _) in sources.items() if not Path(txt_path).exists()]
+    removed += skipped
+    if removed:
+        with conn:
+            delete_file_chunks(cur, removed)
+    if retagged:
+        with conn:
+            cur.executemany("UPDATE text_chunks SET project_id = ? WHERE file_id = ?", retagged)
+            cur.executemany("UPDATE chunk_sources SET project_id = ? WHERE file_id = ?", retagged)
+    db_seconds += time.perf_counter() - db_start
+
     conn.close()
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
     print(f"Terminé. Total chunks insérés: {total_chunks}")
+    if total_chunks:
+        print(f"Tokens par chunk (moyenne) : {total_tokens / total_chunks:.0f}")
+    print(f"Fichiers inchangés (chunks conservés): {nb_unchanged}, dont {len(retagged)} rattachés à un autre projet"
+          f" | fichiers supprimés ou ignorés: {len(removed)}")
+    print(f"En-têtes/pieds de page supprimés : {total_bytes_saved / 1e6:.2f} Mo, {'' if exact_saved else '~'}{total_chunks_saved} chunks en moins à embedder")
+    print(f"Débit : {total_chunks / elapsed:.0f} chunks/s "
+          f"(découpage {split_seconds:.2f}s, SQLite {db_seconds:.2f}s, total {elapsed:.2f}s)")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Découpage des TXT en chunks (incrémental par fichier)")
+    parser.add_argument("--full", action="store_true",
+                        help="Supprimer tous les chunks et tout reconstruire")
+    parser.add_argument("--chunker", choices=CHUNKERS, default="tokens",
+                        help="tokens = budget de tokens du modèle e5 (défaut), chars = 800 caractères (historique)")
+    parser.add_argument("--exact-saved", action="store_true",
+                        help="Compter exactement les chunks évités par la suppression des en-têtes/pieds de page "
+                             "(redécoupe les textes bruts ; par défaut estimation à partir des octets supprimés)")
+    args = parser.parse_args()
+    main(full=args.full, chunker_name=args.chunker, exact_saved=args.exact_saved)
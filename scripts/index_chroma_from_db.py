@@ -1,11 +1,16 @@
+import json
+import time
 import sqlite3
+import argparse
+import numpy as np
 from pathlib import Path
 from tqdm.auto import tqdm
 
-from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 from chromadb import PersistentClient
 
+from utils.embedding_cache import text_hash, get_embeddings, put_embeddings
+
 # ----------------- Config -----------------
 BASE_DIR     = Path(__file__).resolve().parent.parent
 DB_PATH      = BASE_DIR / "database" / "observance.db"
@@ -13,7 +18,17 @@ PERSIST_DIR  = BASE_DIR / "chroma_store"
 COLLECTION   = "gouvernance"
 MODEL_NAME   = "intfloat/multilingual-e5-base"
 
-UPSERT_BATCH = 4000   # must be <= 5461 (Chroma limit)
+# Chunks embedded, upserted into Chroma and recorded in text_chunk_embeddings per step.
+# Each step is committed: after a crash, a re-run resumes from the last committed step.
+CHECKPOINT_BATCH = 256   # must be <= 5461 (Chroma limit)
+GET_BATCH = 5000         # ids read from Chroma per call
+REPORT_IDS = 10          # ids listed per category in the reconciliation report
+
+# Incremental indexing: the collection is no longer dropped. text_chunk_embeddings holds one
+# (chunk_id, model, text_hash, meta_hash) record per chunk present in Chroma; only chunks that are
+# new, changed (text_hash), re-tagged (meta_hash: project_id, section...) or missing from Chroma are
+# upserted (re-tagged ones with their cached vector), and vectors of chunks that were
+# deleted, or marked as duplicates / OCR noise (processing/dedup.py, processing/quality.py), are removed.
 
 # -------------- Device detect -------------
 def detect_device() -> str:
@@ -23,81 +38,193 @@ def detect_device() -> str:
     except Exception:
         return "cpu"
 
-device = detect_device()
-print(f"🔧 Utilisation du device: {device}")
-
-# Load data from DB 
-print("Chargement des chunks depuis la base SQLite...")
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-
-rows = cur.execute("""
-    SELECT id, project_id, file_id, chunk_index, text
-    FROM text_chunks
-    WHERE text IS NOT NULL AND TRIM(text) != ''
-""").fetchall()
-conn.close()
-
-print(f"{len(rows)} chunks trouvés dans la base")
-
-# Prepare embedding 
-# This is the embedding model
-embeddings = HuggingFaceEmbeddings(
-    model_name=MODEL_NAME,
-    model_kwargs={"device": device},
-    encode_kwargs={"normalize_embeddings": True}
-)
-
-# Open Chroma store 
-# Persistent client ensures vectors are stored in chroma_store
-client = PersistentClient(path=str(PERSIST_DIR))
-
-# Clear collection before re-indexing
-try:
-    client.delete_collection(COLLECTION)
-    print(f"Ancienne collection '{COLLECTION}' supprimée.")
-except Exception:
-    pass
-
-client.create_collection(COLLECTION)
-print(f"Nouvelle collection '{COLLECTION}' créée.")
-
-vectorstore = Chroma(
-    collection_name=COLLECTION,
-    client=client,
-    embedding_function=embeddings
-)
-
-
-# Step 4: Prepare data 
-ids = []
-texts = []
-metas = []
-
-for row in rows:
-    chunk_id, project_id, file_id, chunk_index, text = row
-    ids.append(f"chunk_{chunk_id}")  # unique ID
-    texts.append(text)
-    metas.append({
-        "project_id": str(project_id) if project_id else "",
-        "file_id": str(file_id) if file_id else "",
-        "chunk_index": str(chunk_index)
-    })
-
-# Embedding + Indexing 
-print("Début de l'embedding et de l'indexation dans Chroma...")
-
-# NOTE:
-# - Embedding = converting text -> vector (HuggingFace model)
-# - Indexing  = adding vectors + metadata into Chroma collection
-
-for s in tqdm(range(0, len(texts), UPSERT_BATCH), desc="Upserting par batch"):
-    e = s + UPSERT_BATCH
-    vectorstore.add_texts(
-        texts=texts[s:e],
-        metadatas=metas[s:e],
-        ids=ids[s:e]
-    )
-
-print(f"Terminé. {len(texts)} chunks ajoutés à Chroma.")
-print(f"Modèle = {MODEL_NAME} | Device = {device} | Collection = '{COLLECTION}'")
+
+def chroma_id(chunk_id):
+    return f"chunk_{chunk_id}"
+
+
+def load_chunks(cur):
+    """Chunks to index: {chroma id: (chunk_id, text, metadata)}."""
+    # Near-duplicates marked by processing/dedup.py are not embedded: only their canonical copy is indexed.
+    # A duplicate whose canonical copy has since been deleted (re-chunked file) is indexed until dedup re-runs.
+    # Chunks flagged as OCR noise by processing/quality.py are not embedded either.
+    rows = cur.execute("""
+        SELECT c.id, c.project_id, c.file_id, c.chunk_index, c.section, c.text
+        FROM text_chunks c
+        LEFT JOIN files f ON f.id = c.file_id
+        WHERE c.text IS NOT NULL AND TRIM(c.text) != ''
+          AND (c.duplicate_of IS NULL OR NOT EXISTS (SELECT 1 FROM text_chunks d WHERE d.id = c.duplicate_of))
+          AND (f.duplicate_of IS NULL OR NOT EXISTS (SELECT 1 FROM files d WHERE d.id = f.duplicate_of))
+          AND COALESCE(c.low_quality, 0) = 0
+    """).fetchall()
+    chunks = {}
+    for chunk_id, project_id, file_id, chunk_index, section, text in rows:
+        chunks[chroma_id(chunk_id)] = (chunk_id, text, {
+            "project_id": str(project_id) if project_id else "",
+            "file_id": str(file_id) if file_id else "",
+            "chunk_index": str(chunk_index),
+            "section": section or ""   # synthese / avis_detaille / conclusion (retrieval filter)
+        })
+    return chunks
+
+
+def meta_hash(metadata):
+    return text_hash(json.dumps(metadata, sort_keys=True))
+
+
+def load_chroma_ids(collection):
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=GET_BATCH, offset=offset)["ids"]
+        ids.update(page)
+        if len(page) < GET_BATCH:
+            return ids
+        offset += GET_BATCH
+
+
+def reconcile(chunks, records, chroma_ids):
+    """
+    Differences between SQLite (chunks to index + their embedding records) and Chroma.
+    Returns {category: sorted chroma ids}; "new", "changed", "missing", "unrecorded" and
+    "metadata" (same text, other metadata) are upserted, "orphan" vectors are deleted from Chroma.
+    """
+    report = {"new": [], "changed": [], "metadata": [], "missing": [], "unrecorded": [], "orphan": []}
+    for cid, (_, text, metadata) in chunks.items():
+        recorded = records.get(cid)
+        if recorded is None:
+            report["unrecorded" if cid in chroma_ids else "new"].append(cid)
+        elif recorded[1] != text_hash(text):
+            report["changed"].append(cid)
+        elif cid not in chroma_ids:
+            report["missing"].append(cid)
+        elif recorded[2] != meta_hash(metadata):
+            report["metadata"].append(cid)
+    report["orphan"] = sorted(chroma_ids - chunks.keys())
+    return report
+
+
+def print_report(report, nb_chunks, nb_chroma):
+    print(f"Réconciliation SQLite ({nb_chunks} chunks à indexer) / Chroma ({nb_chroma} vecteurs) :")
+    labels = {
+        "new": "nouveaux chunks (jamais indexés)",
+        "changed": "chunks modifiés (text_hash différent)",
+        "metadata": "métadonnées modifiées (project_id, section... ; vecteur repris du cache)",
+        "missing": "enregistrés dans SQLite mais absents de Chroma",
+        "unrecorded": "présents dans Chroma sans enregistrement SQLite",
+        "orphan": "vecteurs Chroma sans chunk à indexer (supprimés, doublons, bruit OCR)",
+    }
+    for category, label in labels.items():
+        ids = report[category]
+        sample = ", ".join(ids[:REPORT_IDS]) + (" ..." if len(ids) > REPORT_IDS else "")
+        print(f"  - {label} : {len(ids)}" + (f" [{sample}]" if ids else ""))
+
+
+def main(full=False, dry_run=False):
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    client = PersistentClient(path=str(PERSIST_DIR))
+
+    if full and not dry_run:
+        # Everything is re-indexed; vectors come from embedding_cache when the texts are unchanged
+        try:
+            client.delete_collection(COLLECTION)
+            print(f"Ancienne collection '{COLLECTION}' supprimée.")
+        except Exception:
+            pass
+        with conn:
+            cur.execute("DELETE FROM text_chunk_embeddings WHERE model = ?", (MODEL_NAME,))
+    collection = client.get_or_create_collection(COLLECTION)
+
+    print("Chargement des chunks depuis la base SQLite...")
+    chunks = load_chunks(cur)
+    records = {
+        chroma_id(chunk_id): (chunk_id, recorded_hash, recorded_meta)
+        for chunk_id, recorded_hash, recorded_meta in cur.execute(
+            "SELECT chunk_id, text_hash, meta_hash FROM text_chunk_embeddings WHERE model = ?", (MODEL_NAME,)
+        )
+    }
+    chroma_ids = load_chroma_ids(collection)
+
+    report = reconcile(chunks, records, chroma_ids)
+    print_report(report, len(chunks), len(chroma_ids))
+    if dry_run:
+        conn.close()
+        return
+
+    # Vectors of chunks that are no longer to be indexed, and their records
+    orphans = report["orphan"]
+    for s in range(0, len(orphans), CHECKPOINT_BATCH):
+        collection.delete(ids=orphans[s:s + CHECKPOINT_BATCH])
+    with conn:
+        cur.executemany(
+            "DELETE FROM text_chunk_embeddings WHERE chunk_id = ? AND model = ?",
+            [(records[cid][0], MODEL_NAME) for cid in records.keys() - chunks.keys()]
+        )
+
+    to_embed = sorted(report["new"] + report["changed"] + report["metadata"] + report["missing"] + report["unrecorded"])
+    print(f"{len(orphans)} vecteurs supprimés | {len(to_embed)} chunks à (ré)indexer "
+          f"({len(chunks) - len(to_embed)} inchangés conservés)")
+    if not to_embed:
+        conn.close()
+        return
+
+    device = detect_device()
+    embeddings = None
+
+    # NOTE:
+    # - Embedding = converting text -> vector (HuggingFace model), skipped for texts already
+    #   in embedding_cache (same text hash and model: re-chunked files, --full, another machine)
+    # - Indexing  = upserting vectors + metadata into the Chroma collection
+    print("Début de l'embedding et de l'indexation dans Chroma...")
+    nb_cached, nb_embedded = 0, 0
+    start_time = time.perf_counter()
+    for s in tqdm(range(0, len(to_embed), CHECKPOINT_BATCH), desc="Upserting par batch"):
+        ids = to_embed[s:s + CHECKPOINT_BATCH]
+        texts = [chunks[cid][1] for cid in ids]
+        hashes = [text_hash(text) for text in texts]
+        vectors = get_embeddings(conn, hashes, MODEL_NAME)
+        # Texts to embed, once each (identical chunks share their hash)
+        missing = {h: text for h, text in zip(hashes, texts) if h not in vectors}
+        nb_cached += len(ids) - sum(h in missing for h in hashes)
+        if missing:
+            if embeddings is None:
+                print(f"🔧 Utilisation du device: {device}")
+                # This is the embedding model
+                embeddings = HuggingFaceEmbeddings(
+                    model_name=MODEL_NAME,
+                    model_kwargs={"device": device},
+                    encode_kwargs={"normalize_embeddings": True}
+                )
+            new_vectors = embeddings.embed_documents(list(missing.values()))
+            with conn:
+                put_embeddings(conn, list(zip(missing, new_vectors)), MODEL_NAME)
+            vectors.update((h, np.asarray(vector, dtype=np.float32)) for h, vector in zip(missing, new_vectors))
+            nb_embedded += len(missing)
+
+        matrix = np.vstack([vectors[h] for h in hashes])
+        collection.upsert(ids=ids, embeddings=matrix, documents=texts,
+                          metadatas=[chunks[cid][2] for cid in ids])
+        # Checkpoint: recorded only once the vectors are in Chroma
+        with conn:
+            cur.executemany("""
+                INSERT OR REPLACE INTO text_chunk_embeddings (chunk_id, model, dim, text_hash, meta_hash)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(chunks[cid][0], MODEL_NAME, matrix.shape[1], h, meta_hash(chunks[cid][2]))
+                  for cid, h in zip(ids, hashes)])
+
+    conn.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"Terminé. {len(to_embed)} chunks indexés dans Chroma en {elapsed:.0f}s "
+          f"({len(to_embed) / max(elapsed, 1e-9):.1f} chunks/s) : {nb_embedded} textes embeddés, "
+          f"{nb_cached} vecteurs repris du cache embedding_cache.")
+    print(f"Modèle = {MODEL_NAME} | Device = {device} | Collection = '{COLLECTION}' ({collection.count()} vecteurs)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexation incrémentale des chunks dans Chroma")
+    parser.add_argument("--full", action="store_true",
+                        help="Supprimer la collection et tout réindexer (les vecteurs du cache sont réutilisés)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Afficher seulement le rapport de réconciliation SQLite / Chroma")
+    args = parser.parse_args()
+    main(full=args.full, dry_run=args.dry_run)
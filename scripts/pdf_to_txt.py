@@ -1,40 +1,245 @@
 import os
-from processing.extract_text import extract_text_with_hybrid_mode
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from processing.extract_text import (
+    extract_text_with_hybrid_mode, init_ocr_worker, EXTRACTOR_VERSION, MIN_OCR_CONFIDENCE, OCR_MODES, PAGE_WINDOW,
+)
+from processing.ocr_engine import OCR_ENGINES
+from processing.text_backends import TEXT_BACKENDS
+from utils.hashing import hash_files
+from utils import manifest
+from utils import ocr_cache
 
-def process_pdf_folder(input_dir, output_dir):
+# Tesseract threads per worker process. With N workers each running its own
+# tesseract, letting every process use all cores oversubscribes the machine.
+OMP_THREAD_LIMIT = 1
+
+MANIFEST_STAGE = "pdf_to_txt"
+# Extraction options that change the produced text (page_window/workers do not)
+OUTPUT_PARAMS = ("cutoff_ratio", "dpi", "lang", "ocr_mode", "adaptive_dpi", "min_confidence", "ocr_engine", "text_backend", "preprocess")
+
+
+def _extract_one(pdf_path, options, pdf_hash=None):
+    return extract_text_with_hybrid_mode(pdf_path, pdf_hash=pdf_hash, **options)
+
+
+def output_paths(output_dir, file):
+    txt_name = os.path.splitext(file)[0]
+    return os.path.join(output_dir, txt_name + ".txt"), os.path.join(output_dir, txt_name + ".log")
+
+
+def save_outputs(output_dir, file, content, log_lines):
+    txt_path, log_path = output_paths(output_dir, file)
+
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    print(f"Text sauvegardé: {txt_path}")
+
+    with open(log_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(log_lines))
+    print(f"Log sauvegardé: {log_path}")
+    return txt_path
+
+
+def reuse_previous_output(entry, output_dir, file):
+    """
+    Reuse a previous extraction of the same content (same hash and parameters).
+    Returns the txt path, or None when the previous output no longer exists.
+    """
+    prev_txt = entry["output_path"]
+    if not prev_txt or not os.path.exists(prev_txt):
+        return None
+
+    txt_path, log_path = output_paths(output_dir, file)
+    if os.path.abspath(prev_txt) != os.path.abspath(txt_path):
+        # Same PDF under another name/folder: copy instead of re-extracting
+        shutil.copyfile(prev_txt, txt_path)
+        prev_log = os.path.splitext(prev_txt)[0] + ".log"
+        if os.path.exists(prev_log):
+            shutil.copyfile(prev_log, log_path)
+    return txt_path
+
+
+def process_pdf_folder(input_dir, output_dir, workers=1, manifest_conn=None, force=False, **options):
+    """
+    Extract every PDF of `input_dir` into `output_dir` (.txt + .log).
+    `options` are passed to extract_text_with_hybrid_mode.
+    With workers > 1 PDFs are spread over a process pool and page-level
+    parallelism (options["workers"]) is disabled to avoid nested pools.
+    With a manifest connection, PDFs whose content hash and extraction
+    parameters are already recorded are skipped (unless force=True).
+    Returns (nb_pdfs_extracted, nb_pages, seconds, nb_skipped).
+    """
     os.makedirs(output_dir, exist_ok=True)
     files = [f for f in os.listdir(input_dir) if f.lower().endswith(".pdf")]
 
     print(f"Traitement du dossier : {input_dir} (Total : {len(files)} fichiers PDF)")
 
-    for idx, file in enumerate(files, 1):
+    start = time.perf_counter()
+    params_key = manifest.make_params_key(
+        EXTRACTOR_VERSION, **{k: options[k] for k in OUTPUT_PARAMS if k in options}
+    )
+
+    # Incremental mode: only new or changed PDFs are extracted
+    todo = []
+    hashes = {}
+    nb_skipped = 0
+    if manifest_conn is not None:
+        # Threaded hashing; files unchanged since the last run (size, mtime) are not re-read
+        path_hashes = hash_files([os.path.join(input_dir, file) for file in files])
+        hashes = {file: path_hashes[os.path.join(input_dir, file)] for file in files}
+    for file in files:
         pdf_path = os.path.join(input_dir, file)
-        txt_name = os.path.splitext(file)[0]
-        txt_path = os.path.join(output_dir, txt_name + ".txt")
-        log_path = os.path.join(output_dir, txt_name + ".log")
+        if manifest_conn is not None:
+            file_hash = hashes[file]
+            entry = None if force else manifest.lookup(manifest_conn, MANIFEST_STAGE, file_hash, params_key)
+            if entry:
+                txt_path = reuse_previous_output(entry, output_dir, file)
+                if txt_path:
+                    manifest.record(manifest_conn, MANIFEST_STAGE, file_hash, params_key, pdf_path, txt_path)
+                    nb_skipped += 1
+                    continue
+        todo.append(file)
 
-        print(f"\n ({idx}/{len(files)}) Fichier: {file}")
-        content, log_lines = extract_text_with_hybrid_mode(pdf_path)
+    if manifest_conn is not None:
+        print(f"{nb_skipped} PDF inchangés ignorés, {len(todo)} à extraire")
 
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        print(f"Text sauvegardé: {txt_path}")
+    def done(file, content, log_lines):
+        txt_path = save_outputs(output_dir, file, content, log_lines)
+        if manifest_conn is not None:
+            manifest.record(
+                manifest_conn, MANIFEST_STAGE, hashes[file], params_key,
+                os.path.join(input_dir, file), txt_path,
+            )
+        return len(log_lines)
 
-        with open(log_path, 'w', encoding='utf-8') as f:
-            f.write("\n".join(log_lines))
-        print(f"Log sauvegardé: {log_path}")
-    
+    nb_pages = 0
+    if workers <= 1:
+        for idx, file in enumerate(todo, 1):
+            pdf_path = os.path.join(input_dir, file)
+            print(f"\n ({idx}/{len(todo)}) Fichier: {file}")
+            content, log_lines = _extract_one(pdf_path, options, hashes.get(file))
+            nb_pages += done(file, content, log_lines)
+    else:
+        options = {**options, "workers": 1}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_ocr_worker,
+            initargs=(OMP_THREAD_LIMIT,),
+        ) as pool:
+            futures = {
+                pool.submit(_extract_one, os.path.join(input_dir, file), options, hashes.get(file)): file
+                for file in todo
+            }
+            # Outputs are written as soon as each PDF is done, not in listing order
+            for idx, future in enumerate(as_completed(futures), 1):
+                file = futures[future]
+                print(f"\n ({idx}/{len(todo)}) Fichier: {file}")
+                try:
+                    content, log_lines = future.result()
+                except Exception as e:
+                    print(f"Erreur d'extraction pour {file}: {e}")
+                    continue
+                nb_pages += done(file, content, log_lines)
+
+    elapsed = time.perf_counter() - start
     print("Terminé : Tous les fichiers ont été traités!")
+    print_throughput(len(todo), nb_pages, elapsed)
+    return len(todo), nb_pages, elapsed, nb_skipped
+
+
+def print_throughput(nb_pdfs, nb_pages, seconds):
+    seconds = max(seconds, 1e-9)
+    print(
+        f"Débit : {nb_pdfs} PDF, {nb_pages} pages en {seconds:.1f}s "
+        f"({nb_pdfs / seconds:.2f} PDF/s, {nb_pages / seconds:.2f} pages/s)"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extraction texte (pdfplumber + OCR) des PDF vers TXT")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de processus (1 = séquentiel)")
+    parser.add_argument("--page-workers", type=int, default=1,
+                        help="Processus par document (découpage des pages, utile pour les très gros PDF)")
+    parser.add_argument("--ocr-mode", choices=OCR_MODES, default="always")
+    parser.add_argument("--ocr-engine", choices=OCR_ENGINES, default="subprocess",
+                        help="subprocess = pytesseract, tesserocr = modèle chargé une fois par processus")
+    parser.add_argument("--text-backend", choices=TEXT_BACKENDS, default="pdfplumber",
+                        help="Lecture de la couche texte native (pdfium = plus rapide)")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Nettoyer les images avant OCR (gris, Otsu, redressement, recadrage)")
+    parser.add_argument("--timings", action="store_true",
+                        help="Ajouter la latence OCR de chaque page dans les .log")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--adaptive-dpi", type=int, default=None,
+                        help="OCR d'abord à ce DPI, re-rendu à --dpi si la confiance est trop basse")
+    parser.add_argument("--min-confidence", type=float, default=MIN_OCR_CONFIDENCE)
+    parser.add_argument("--lang", default="fra")
+    parser.add_argument("--cutoff-ratio", type=float, default=0.85)
+    parser.add_argument("--page-window", type=int, default=PAGE_WINDOW,
+                        help="Nombre de pages rasterisées en même temps")
+    parser.add_argument("--full", action="store_true",
+                        help="Ré-extraire tous les PDF, même ceux déjà présents dans le manifeste")
+    parser.add_argument("--manifest", default=manifest.MANIFEST_DB)
+    parser.add_argument("--ocr-cache", default=ocr_cache.OCR_CACHE_DB,
+                        help="Cache OCR par page (chemin SQLite)")
+    parser.add_argument("--no-ocr-cache", action="store_true")
+    parser.add_argument("--ocr-cache-max-mb", type=int, default=ocr_cache.OCR_CACHE_MAX_BYTES // 1024 ** 2)
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
+    options = {
+        "cutoff_ratio": args.cutoff_ratio,
+        "dpi": args.dpi,
+        "adaptive_dpi": args.adaptive_dpi,
+        "min_confidence": args.min_confidence,
+        "lang": args.lang,
+        "ocr_mode": args.ocr_mode,
+        "page_window": args.page_window,
+        "workers": args.page_workers,
+        "ocr_engine": args.ocr_engine,
+        "log_timings": args.timings,
+        "text_backend": args.text_backend,
+        "preprocess": args.preprocess,
+        "ocr_cache": None if args.no_ocr_cache else args.ocr_cache,
+    }
+    manifest_conn = manifest.open_manifest(args.manifest)
+
     input_folders = [
         "data/avis_pdf",
         "data/reponse_pdf",
         "data/couples_pdf",
         "data/experimentation_pdf"
     ]
-    
+
+    total_pdfs, total_pages, total_seconds, total_skipped = 0, 0, 0.0, 0
     for folder in input_folders:
         folder_name = os.path.basename(folder)
         output_folder = f"data/{folder_name.replace('_pdf', '_txt')}"
-        process_pdf_folder(folder, output_folder)
\ No newline at end of file
+        nb_pdfs, nb_pages, seconds, nb_skipped = process_pdf_folder(
+            folder, output_folder, workers=args.workers,
+            manifest_conn=manifest_conn, force=args.full,
+            **options,
+        )
+        total_pdfs += nb_pdfs
+        total_pages += nb_pages
+        total_seconds += seconds
+        total_skipped += nb_skipped
+
+    manifest_conn.close()
+
+    if options["ocr_cache"]:
+        cache_conn = ocr_cache.open_ocr_cache(options["ocr_cache"])
+        evicted = ocr_cache.evict(cache_conn, args.ocr_cache_max_mb * 1024 ** 2)
+        cache_conn.close()
+        if evicted:
+            print(f"Cache OCR : {evicted} pages évincées")
+
+    print("\nRésumé global")
+    print_throughput(total_pdfs, total_pages, total_seconds)
+    print(f"PDF inchangés ignorés : {total_skipped}")
@@ -46,12 +46,19 @@ vectorstore = Chroma(
 
 # Retrieval
 def search_docs(query: str, k: int = 4, project_id: Optional[int] = None,
-                use_mmr: bool = True, fetch_k: Optional[int] = None) -> List[Document]:
+                use_mmr: bool = True, fetch_k: Optional[int] = None,
+                section: Optional[str] = None) -> List[Document]:
     """
     Retrieve top-k docs from Chroma using native API (bypassing LangChain wrapper).
-    Filter by project_id if given.
+    Filter by project_id and/or section ('synthese', 'avis_detaille', 'conclusion') if given.
     """
-    filt = {"project_id": str(project_id)} if project_id not in (None, "", "None") else None
+    conditions = []
+    if project_id not in (None, "", "None"):
+        conditions.append({"project_id": str(project_id)})
+    if section:
+        conditions.append({"section": section})
+    # Chroma needs an explicit $and to combine several metadata conditions
+    filt = conditions[0] if len(conditions) == 1 else ({"$and": conditions} if conditions else None)
     print(f"query='{query}' | where={filt}")
 
     # Embed query
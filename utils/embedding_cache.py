@@ -0,0 +1,50 @@
+import hashlib
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Chunk embeddings keyed by (text hash, model), in the embedding_cache table of observance.db
+# (database/init_database.py). Vectors are little-endian float32 BLOBs (dim * 4 bytes, ~4x
+# smaller than JSON text) read back zero-copy with np.frombuffer. Keys do not depend on chunk
+# ids, so re-chunking, a Chroma rebuild or a copy of the database on another machine reuse them.
+VECTOR_DTYPE = np.dtype("<f4")
+LOOKUP_BATCH = 500           # hashes per IN (...) query (SQLite variable limit)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def to_blob(vector) -> bytes:
+    return np.asarray(vector, dtype=VECTOR_DTYPE).tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    """Read-only float32 view on the BLOB (no copy)."""
+    return np.frombuffer(blob, dtype=VECTOR_DTYPE)
+
+
+def get_embeddings(conn: sqlite3.Connection, hashes: Iterable[str], model: str) -> Dict[str, np.ndarray]:
+    """Cached vectors of `hashes` for `model` ({text_hash: vector}; missing hashes are absent)."""
+    hashes = list(set(hashes))
+    found = {}
+    for s in range(0, len(hashes), LOOKUP_BATCH):
+        batch = hashes[s:s + LOOKUP_BATCH]
+        rows = conn.execute(
+            f"""
+            SELECT text_hash, vector FROM embedding_cache
+            WHERE model = ? AND text_hash IN ({",".join("?" * len(batch))})
+            """,
+            [model, *batch],
+        )
+        found.update((h, from_blob(blob)) for h, blob in rows)
+    return found
+
+
+def put_embeddings(conn: sqlite3.Connection, rows: List[Tuple[str, object]], model: str) -> None:
+    """Store (text_hash, vector) rows for `model` (the caller commits)."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO embedding_cache (text_hash, model, dim, vector) VALUES (?, ?, ?, ?)",
+        [(h, model, len(vector), to_blob(vector)) for h, vector in rows],
+    )
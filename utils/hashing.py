@@ -1,16 +1,146 @@
+import os
+import mmap
+import time
+import sqlite3
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
-def compute_file_hash(file_path, algo="sha256", block_size=65536):
-    """Return hash from file contents"""
+try:
+    import xxhash
+except ImportError:  # optional, only needed for algo="xxh3"
+    xxhash = None
+
+# Sidecar cache: (path, algo, size, mtime_ns) -> hash, so unchanged files are never re-read
+HASH_CACHE_DB = os.path.join("data", "hash_cache.db")
+HASH_WORKERS = 8
+# Large files are hashed through mmap, in slices of this size
+MMAP_SLICE = 16 * 1024 * 1024
+# Non-cryptographic, dedup-only: xxh3 when installed, else blake2b (stdlib, faster than sha256)
+FAST_ALGO = "xxh3" if xxhash is not None else "blake2b"
+
+
+def _new_hasher(algo):
     if algo == "sha256":
-        hasher = hashlib.sha256()
+        return hashlib.sha256()
     elif algo == "md5":
-        hasher = hashlib.md5()
+        return hashlib.md5()
+    elif algo == "blake2b":
+        return hashlib.blake2b()
+    elif algo == "xxh3":
+        if xxhash is None:
+            raise ValueError("algo='xxh3' requires `pip install xxhash`")
+        return xxhash.xxh3_128()
     else:
         raise ValueError("Unsupported hash algorithm")
-    
+
+
+def compute_file_hash(file_path, algo="sha256", block_size=65536):
+    """Return hash from file contents"""
+    hasher = _new_hasher(algo)
+
     with open(file_path, "rb") as f:
         for block in iter(lambda: f.read(block_size), b""):
             hasher.update(block)
     return hasher.hexdigest()
 
+
+def hash_file_mmap(file_path, algo="sha256"):
+    """Same result as compute_file_hash, reading the file through mmap (no per-block copies)."""
+    hasher = _new_hasher(algo)
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return hasher.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                for start in range(0, size, MMAP_SLICE):
+                    # hashlib releases the GIL on large buffers: threads hash in parallel
+                    hasher.update(view[start:start + MMAP_SLICE])
+            finally:
+                view.release()
+    return hasher.hexdigest()
+
+
+def open_hash_cache(db_path=HASH_CACHE_DB):
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            path TEXT NOT NULL,
+            algo TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (path, algo)
+        )
+        """
+    )
+    return conn
+
+
+def hash_files(paths, algo="sha256", workers=HASH_WORKERS, cache_path=HASH_CACHE_DB):
+    """
+    Hash many files with a thread pool. Returns {path: hexdigest}.
+    With a cache path, files whose (path, size, mtime_ns) did not change are not read again.
+    """
+    stats = {}
+    for path in paths:
+        st = os.stat(path)
+        stats[os.path.abspath(path)] = (path, st.st_size, st.st_mtime_ns)
+
+    hashes = {}
+    conn = open_hash_cache(cache_path) if cache_path else None
+    if conn is not None:
+        rows = conn.execute("SELECT path, size, mtime_ns, hash FROM file_hashes WHERE algo = ?", (algo,))
+        for abs_path, size, mtime_ns, digest in rows:
+            if abs_path in stats and stats[abs_path][1:] == (size, mtime_ns):
+                hashes[stats[abs_path][0]] = digest
+
+    todo = [abs_path for abs_path, (path, _, _) in stats.items() if path not in hashes]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = pool.map(lambda p: hash_file_mmap(p, algo), todo)
+        computed = list(zip(todo, digests))
+
+    for abs_path, digest in computed:
+        hashes[stats[abs_path][0]] = digest
+
+    if conn is not None:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO file_hashes (path, algo, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)",
+                [(abs_path, algo, *stats[abs_path][1:], digest) for abs_path, digest in computed],
+            )
+        conn.close()
+    return hashes
+
+
+def hash_tree(root, algo="sha256", workers=HASH_WORKERS, cache_path=HASH_CACHE_DB, extensions=None):
+    """Hash every file under `root` (optionally only the given extensions, e.g. ('.pdf',))."""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if extensions is None or name.lower().endswith(tuple(extensions)):
+                paths.append(os.path.join(dirpath, name))
+    return hash_files(paths, algo=algo, workers=workers, cache_path=cache_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Hash d'une arborescence (pool de threads + cache)")
+    parser.add_argument("root")
+    parser.add_argument("--algo", default="sha256", choices=["sha256", "md5", "blake2b", "xxh3"])
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = hash_tree(args.root, args.algo, args.workers, None if args.no_cache else HASH_CACHE_DB)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    total_bytes = sum(os.path.getsize(p) for p in result)
+    print(f"{len(result)} fichiers, {total_bytes / 1e6:.1f} Mo en {elapsed:.2f}s "
+          f"({total_bytes / 1e6 / elapsed:.1f} Mo/s)")
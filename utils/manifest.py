@@ -0,0 +1,66 @@
+import os
+import json
+import sqlite3
+from typing import Any, Dict, Optional
+
+# Small SQLite manifest recording which source files were already processed,
+# keyed by content hash + processing version/parameters.
+MANIFEST_DB = os.path.join("data", "manifest.db")
+
+
+def open_manifest(db_path: str = MANIFEST_DB) -> sqlite3.Connection:
+    """Open (and create if needed) the manifest database."""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS manifest (
+            stage TEXT NOT NULL,              -- e.g. 'pdf_to_txt'
+            file_hash TEXT NOT NULL,          -- sha256 of the source file
+            params_key TEXT NOT NULL,         -- version + parameters (JSON)
+            source_path TEXT,
+            output_path TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (stage, file_hash, params_key)
+        )
+        """
+    )
+    return conn
+
+
+def make_params_key(version: str, **params: Any) -> str:
+    """Stable string identifying a processing version and its parameters."""
+    return json.dumps({"version": version, **params}, sort_keys=True)
+
+
+def lookup(conn: sqlite3.Connection, stage: str, file_hash: str, params_key: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute(
+        """
+        SELECT source_path, output_path, updated_at
+        FROM manifest
+        WHERE stage = ? AND file_hash = ? AND params_key = ?
+        """,
+        (stage, file_hash, params_key),
+    ).fetchone()
+    return dict(row) if row else None
+
+
+def record(
+    conn: sqlite3.Connection,
+    stage: str,
+    file_hash: str,
+    params_key: str,
+    source_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+) -> None:
+    with conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO manifest (stage, file_hash, params_key, source_path, output_path)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (stage, file_hash, params_key, source_path, output_path),
+        )
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+from typing import Optional, Tuple
+
+# Page-level OCR results, keyed by (pdf hash, page, dpi, lang, tesseract version, variant).
+# `variant` identifies the OCR engine, the text source (with / without confidence) and the
+# image preprocessing or region cropped before OCR (see processing/extract_text.py).
+# Lets us re-run extraction (new cutoff_ratio, cleaning rules...) without re-OCRing pages.
+OCR_CACHE_DB = os.path.join("data", "ocr_cache.db")
+OCR_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+CREATE_OCR_PAGES = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        pdf_hash TEXT NOT NULL,
+        page INTEGER NOT NULL,            -- 1-based
+        dpi INTEGER NOT NULL,
+        lang TEXT NOT NULL,
+        tesseract_version TEXT NOT NULL,
+        variant TEXT NOT NULL DEFAULT '', -- engine, text source, preprocessing/region of the image
+        text TEXT NOT NULL,
+        conf REAL,                        -- mean word confidence, when computed
+        size INTEGER NOT NULL,            -- bytes of text (for eviction)
+        last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (pdf_hash, page, dpi, lang, tesseract_version, variant)
+    )
+"""
+
+
+def _migrate_add_variant(conn: sqlite3.Connection, columns: set) -> None:
+    """Rebuild caches created before `variant` was part of the key (keeps existing entries)."""
+    conf = "conf" if "conf" in columns else "NULL"
+    with conn:
+        conn.execute(CREATE_OCR_PAGES.format(table="ocr_pages_new"))
+        conn.execute(
+            f"""
+            INSERT INTO ocr_pages_new
+              (pdf_hash, page, dpi, lang, tesseract_version, variant, text, conf, size, last_used)
+            SELECT pdf_hash, page, dpi, lang, tesseract_version, '', text, {conf}, size, last_used
+            FROM ocr_pages
+            """
+        )
+        conn.execute("DROP TABLE ocr_pages")
+        conn.execute("ALTER TABLE ocr_pages_new RENAME TO ocr_pages")
+
+
+def open_ocr_cache(db_path: str = OCR_CACHE_DB) -> sqlite3.Connection:
+    """Open (and create if needed) the OCR cache. Safe to open from several worker processes."""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ocr_pages)")}
+    if columns and "variant" not in columns:
+        _migrate_add_variant(conn, columns)
+    conn.execute(CREATE_OCR_PAGES.format(table="ocr_pages"))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_pages_last_used ON ocr_pages(last_used)")
+    return conn
+
+
+def get_ocr(
+    conn: sqlite3.Connection,
+    pdf_hash: str,
+    page: int,
+    dpi: int,
+    lang: str,
+    tesseract_version: str,
+    variant: str = "",
+) -> Optional[Tuple[str, Optional[float]]]:
+    """Return (text, conf) for a cached page, or None."""
+    key = (pdf_hash, page, dpi, lang, tesseract_version, variant)
+    row = conn.execute(
+        """
+        SELECT text, conf FROM ocr_pages
+        WHERE pdf_hash = ? AND page = ? AND dpi = ? AND lang = ? AND tesseract_version = ? AND variant = ?
+        """,
+        key,
+    ).fetchone()
+    if row is None:
+        return None
+    with conn:
+        conn.execute(
+            """
+            UPDATE ocr_pages SET last_used = CURRENT_TIMESTAMP
+            WHERE pdf_hash = ? AND page = ? AND dpi = ? AND lang = ? AND tesseract_version = ? AND variant = ?
+            """,
+            key,
+        )
+    return row[0], row[1]
+
+
+def put_ocr(
+    conn: sqlite3.Connection,
+    pdf_hash: str,
+    page: int,
+    dpi: int,
+    lang: str,
+    tesseract_version: str,
+    text: str,
+    conf: Optional[float] = None,
+    variant: str = "",
+) -> None:
+    with conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO ocr_pages
+              (pdf_hash, page, dpi, lang, tesseract_version, variant, text, conf, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (pdf_hash, page, dpi, lang, tesseract_version, variant, text, conf, len(text.encode("utf-8"))),
+        )
+
+
+def evict(conn: sqlite3.Connection, max_bytes: int = OCR_CACHE_MAX_BYTES) -> int:
+    """Delete least recently used pages until the cache fits in max_bytes. Returns the number of rows deleted."""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_pages").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+
+    to_free = total - max_bytes
+    freed = 0
+    doomed = []
+    for rowid, size in conn.execute("SELECT rowid, size FROM ocr_pages ORDER BY last_used, rowid"):
+        if freed >= to_free:
+            break
+        doomed.append((rowid,))
+        freed += size
+
+    with conn:
+        conn.executemany("DELETE FROM ocr_pages WHERE rowid = ?", doomed)
+    conn.execute("VACUUM")
+    return len(doomed)